@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""bench_concurrent_moves.py - Concurrent make_move calls on shared games.
+
+Several threads call the make_move endpoint on the same few games at once,
+against the local datastore stub. Each thread guesses its own share of the
+letters missing from the target word, so every accepted guess changes the
+game and none ends it. Afterwards every game is checked for lost updates:
+its guessed letters, move_count, version, Move log and attempts remaining
+must match exactly the guesses that were accepted. Reports throughput,
+transaction retries, rejected moves (409) and the contention rate, i.e. the
+share of move transactions that had to be retried.
+
+Requires the App Engine Python SDK; pass its location with --sdk or the
+APPENGINE_SDK environment variable.
+
+Usage: python benchmarks/bench_concurrent_moves.py --sdk PATH [--threads N]
+       [--games N]"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'hangmanAPI')
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def setup_sdk(sdk):
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+
+def player(service, plays, accepted, rejected, lock):
+    """Plays [(urlsafe, letter)] in order, noting each outcome"""
+    import endpoints
+    from api import MAKE_MOVE_REQUEST
+    for urlsafe, letter in plays:
+        request = MAKE_MOVE_REQUEST.combined_message_class(
+            urlsafe_game_key=urlsafe, guess_letter=letter)
+        try:
+            service.make_move(request)
+        except endpoints.ConflictException:
+            with lock:
+                rejected.append((urlsafe, letter))
+        else:
+            with lock:
+                accepted.setdefault(urlsafe, set()).add(letter)
+
+
+def check(games, accepted):
+    """Returns a list of lost or phantom updates found in the stored games"""
+    from google.appengine.ext import ndb
+    from engine import mask_to_letters
+    from models import Move
+    ndb.get_context().clear_cache()
+    errors = []
+    for game in ndb.get_multi([game.key for game in games]):
+        letters = accepted.get(game.key.urlsafe(), set())
+        moves = Move.query(ancestor=game.key).count()
+        found = {'letters': set(mask_to_letters(game.guessed_mask or 0)),
+                 'move_count': game.move_count, 'version': game.version,
+                 'moves logged': moves,
+                 'attempts used': (game.attempts_allowed -
+                                   game.attempts_remaining)}
+        for name, value in sorted(found.items()):
+            expected = letters if name == 'letters' else len(letters)
+            if value != expected:
+                errors.append('{}: {} is {}, expected {}'.format(
+                    game.key.id(), name, value, expected))
+    return errors
+
+
+def run(threads, games, seed):
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(root_path=APP_DIR)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=APP_DIR)
+    try:
+        from api import HangmanApi
+        from cache import game_cache
+        from dictionary import get_dictionary
+        from models import Game, User
+
+        user = User.create('bench', 'bench@example.com')
+        words = get_dictionary()
+        rng = random.Random(seed)
+        created, plays = [], []
+        for _ in range(games):
+            word = words.random_word()
+            # Enough attempts that missing every letter cannot end the game
+            game = Game(user=user.key, target_word=word,
+                        attempts_allowed=len(ALPHABET),
+                        attempts_remaining=len(ALPHABET))
+            game.put()
+            created.append(game)
+            plays += [(game.key.urlsafe(), letter) for letter in ALPHABET
+                      if letter not in word]
+        rng.shuffle(plays)
+
+        service = HangmanApi()
+        accepted, rejected, lock = {}, [], threading.Lock()
+        retries_before = game_cache.stats()['retries']
+        workers = [threading.Thread(target=player,
+                                    args=(service, plays[i::threads],
+                                          accepted, rejected, lock))
+                   for i in range(threads)]
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - started
+        retries = game_cache.stats()['retries'] - retries_before
+
+        committed = sum(len(letters) for letters in accepted.values())
+        transactions = committed + retries
+        print('{:<22} {:>10}'.format('threads', threads))
+        print('{:<22} {:>10}'.format('games', games))
+        print('{:<22} {:>10}'.format('moves', len(plays)))
+        print('{:<22} {:>10}'.format('committed', committed))
+        print('{:<22} {:>10}'.format('rejected (409)', len(rejected)))
+        print('{:<22} {:>10}'.format('retries', retries))
+        print('{:<22} {:>10.1%}'.format(
+            'contention rate',
+            retries / float(transactions) if transactions else 0.0))
+        print('{:<22} {:>10.1f}'.format('moves/sec', len(plays) / elapsed))
+
+        errors = check(created, accepted)
+        for error in errors:
+            print('LOST UPDATE ' + error)
+        print('{:<22} {:>10}'.format('lost updates', len(errors)))
+        return not errors
+    finally:
+        bed.deactivate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'))
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--games', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.sdk:
+        parser.error('the App Engine SDK location is required (--sdk)')
+    setup_sdk(args.sdk)
+    sys.exit(0 if run(args.threads, args.games, args.seed) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""bench_index_writes.py - Datastore write operations per move, before and
+after trimming indexes.
+
+Plays the same games twice against the local datastore stub: once storing
+them with the original schema (every Game and Score property indexed, the
+move log in Game.history, one put per move) and once with the current models,
+each move run through game_cache.update as make_move runs it. The tasks the
+moves queue (the Score and UserStats of a finished game, the counters and
+the high score boards) are then run through main.app, so their writes count
+too. The write costs reported by the stub for each Put/Commit are summed,
+split into entity and index writes.
+
+Requires the App Engine Python SDK; pass its location with --sdk or the
+APPENGINE_SDK environment variable.
+
+Usage: python benchmarks/bench_index_writes.py --sdk PATH [--games N]"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'hangmanAPI')
+
+
+def setup_sdk(sdk):
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+
+class WriteCounter(object):
+    """Sums the write cost of datastore Put and Commit calls"""
+
+    def __init__(self):
+        self.entity_writes = 0
+        self.index_writes = 0
+
+    def hook(self, service, call, request, response, *args):
+        if service == 'datastore_v3' and call in ('Put', 'Commit') and \
+                response.has_cost():
+            self.entity_writes += response.cost().entity_writes()
+            self.index_writes += response.cost().index_writes()
+
+
+def legacy_models():
+    """The Game and Score models as first deployed"""
+    from google.appengine.ext import ndb
+
+    class LegacyGame(ndb.Model):
+        target_word = ndb.StringProperty(required=True)
+        guess_word = ndb.StringProperty()
+        guess_letter = ndb.StringProperty()
+        guessed_letters = ndb.StringProperty()
+        attempts_allowed = ndb.IntegerProperty(required=True)
+        attempts_remaining = ndb.IntegerProperty(required=True, default=12)
+        history = ndb.StringProperty()
+        game_over = ndb.BooleanProperty(required=True, default=False)
+        user = ndb.KeyProperty(required=True, kind='User')
+
+    class LegacyScore(ndb.Model):
+        user = ndb.KeyProperty(required=True, kind='User')
+        date = ndb.DateProperty(required=True)
+        won = ndb.BooleanProperty(required=True)
+        guesses = ndb.IntegerProperty(required=True)
+
+    return LegacyGame, LegacyScore
+
+
+def play_legacy(schema, user, word, letters, attempts):
+    """Stores a game the way the original make_move did. Returns moves."""
+    from datetime import date
+    from engine import Board, play_move
+    LegacyGame, LegacyScore = schema
+    game = LegacyGame(user=user, target_word=word, attempts_allowed=attempts,
+                      attempts_remaining=attempts, guessed_letters='',
+                      history='')
+    game.put()
+    board = Board(word)
+    moves = 0
+    for letter in letters:
+        result = play_move(board, game.attempts_remaining, letter)
+        moves += 1
+        game.guess_letter = letter
+        game.guessed_letters += letter
+        game.attempts_remaining = result.attempts_remaining
+        game.history += '{}:{};'.format(letter, result.message)
+        game.put()
+        if result.game_over:
+            game.game_over = True
+            game.put()
+            LegacyScore(user=user, date=date.today(), won=result.won,
+                        guesses=attempts - game.attempts_remaining).put()
+            break
+    return moves
+
+
+def play_current(schema, user, word, letters, attempts):
+    """Plays a game the way make_move does, one transaction per move.
+    Returns moves."""
+    from api import _mover
+    from cache import game_cache
+    from models import Game, MakeMoveForm
+    game = Game(user=user, target_word=word, attempts_allowed=attempts,
+                attempts_remaining=attempts)
+    game.put()
+    moves = 0
+    for letter in letters:
+        mutate = _mover([MakeMoveForm(guess_letter=letter)])
+        game, _ = game_cache.update(game.key.urlsafe(), mutate)
+        moves += 1
+        if game.game_over:
+            break
+    return moves
+
+
+def run_tasks(taskqueue_stub):
+    """Runs the queued tasks, and the tasks they queue, through main.app"""
+    import main
+    queues = ('default', 'high-scores')
+    while True:
+        tasks = [(queue, task) for queue in queues
+                 for task in taskqueue_stub.get_filtered_tasks(
+                     queue_names=[queue])]
+        if not tasks:
+            return
+        for queue, task in tasks:
+            taskqueue_stub.DeleteTask(queue, task.name)
+            response = main.app.get_response(task.url, POST=task.payload)
+            if response.status_int >= 300:
+                raise RuntimeError('{} failed: {}'.format(task.url,
+                                                         response.status))
+
+
+def run(games, seed):
+    from google.appengine.api import apiproxy_stub_map
+    from google.appengine.ext import ndb, testbed
+    from dictionary import get_dictionary
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(root_path=APP_DIR)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=APP_DIR)
+    from models import User
+    user = User(name='bench')
+    user.put()
+    words = get_dictionary()
+    rng = random.Random(seed)
+    plays = []
+    for _ in range(games):
+        letters = list('abcdefghijklmnopqrstuvwxyz')
+        rng.shuffle(letters)
+        plays.append((words.random_word(), letters))
+
+    try:
+        print('{:<10} {:>7} {:>14} {:>14} {:>14}'.format(
+            'schema', 'moves', 'entity/move', 'index/move', 'total/move'))
+        for name, play, schema in (('before', play_legacy, legacy_models()),
+                                   ('after', play_current, None)):
+            counter = WriteCounter()
+            apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+                'bench_' + name, counter.hook)
+            moves = 0
+            for word, letters in plays:
+                ndb.get_context().clear_cache()
+                moves += play(schema, user.key, word, letters, 12)
+            run_tasks(bed.get_stub(testbed.TASKQUEUE_SERVICE_NAME))
+            apiproxy_stub_map.apiproxy.GetPostCallHooks().Clear()
+            print('{:<10} {:>7} {:>14.2f} {:>14.2f} {:>14.2f}'.format(
+                name, moves, counter.entity_writes / float(moves),
+                counter.index_writes / float(moves),
+                (counter.entity_writes + counter.index_writes) /
+                float(moves)))
+    finally:
+        bed.deactivate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'))
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.sdk:
+        parser.error('the App Engine SDK location is required (--sdk)')
+    setup_sdk(args.sdk)
+    run(args.games, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""bench_make_move.py - Replays recorded games through the board logic that
+make_move used before engine.py and through the incremental engine.
+
+Games are recorded once (random letter guesses against words from
+wordlist.txt, seeded for repeatability) and then replayed move by move
+through both implementations, which must agree on every board.
+
+Usage: python benchmarks/bench_make_move.py [--games N] [--repeat N]"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hangmanAPI'))
+
+from dictionary import ALPHABET, WordDictionary, WORDLIST_PATH
+from engine import Board, play_move
+
+
+def record_games(count, attempts=12, seed=1):
+    """Returns [(target_word, [letter, ...]), ...]"""
+    rng = random.Random(seed)
+    words = list(WordDictionary.from_file(WORDLIST_PATH))
+    games = []
+    for _ in range(count):
+        word = rng.choice(words)
+        letters = list(ALPHABET)
+        rng.shuffle(letters)
+        guesses = []
+        misses = 0
+        for letter in letters:
+            guesses.append(letter)
+            if letter not in word:
+                misses += 1
+            if misses == attempts:
+                break
+        games.append((word, guesses))
+    return games
+
+
+def old_board(target_word, guessed_letters):
+    """The board rebuild make_move performed before engine.py"""
+    strip_unicode_letter_history = [str(x) for x in guessed_letters]
+    print_hint = [str(x) for x in target_word]
+    show_hint = []
+    for i in range(len(print_hint)):
+        for x in range(len(strip_unicode_letter_history)):
+            if x == max(range(len(strip_unicode_letter_history))):
+                if strip_unicode_letter_history[x] == print_hint[i]:
+                    show_hint.append(strip_unicode_letter_history[x])
+                else:
+                    show_hint.append('_')
+            elif strip_unicode_letter_history[x] == print_hint[i]:
+                show_hint.append(strip_unicode_letter_history[x])
+                break
+    return ' '.join(show_hint)
+
+
+def replay_old(games, attempts=12):
+    boards = []
+    for word, guesses in games:
+        guessed_letters = ''
+        remaining = attempts
+        for letter in guesses:
+            if letter in guessed_letters:
+                continue
+            if letter not in word:
+                remaining -= 1
+            guessed_letters += letter
+            boards.append(old_board(word, guessed_letters))
+            if remaining < 1:
+                break
+    return boards
+
+
+def replay_new(games, attempts=12):
+    boards = []
+    for word, guesses in games:
+        # Like make_move, the board is rebuilt from the stored mask once per
+        # request and then updated incrementally.
+        mask = 0
+        remaining = attempts
+        for letter in guesses:
+            board = Board(word, mask)
+            move = play_move(board, remaining, guess_letter=letter)
+            mask = board.guessed_mask
+            remaining = move.attempts_remaining
+            boards.append(move.message.replace('  Game over!', ''))
+            if move.game_over:
+                break
+    return boards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    games = record_games(args.games)
+    moves = sum(len(guesses) for _, guesses in games)
+    if replay_old(games) != replay_new(games):
+        sys.exit('engines disagree on the replayed boards')
+
+    old = min(timeit.repeat(lambda: replay_old(games), number=1,
+                            repeat=args.repeat))
+    new = min(timeit.repeat(lambda: replay_new(games), number=1,
+                            repeat=args.repeat))
+    print('replayed:          {} games, {} moves'.format(len(games), moves))
+    print('old (per move):    {:8.2f} us'.format(old / moves * 1e6))
+    print('new (per move):    {:8.2f} us'.format(new / moves * 1e6))
+    print('speedup:           {:8.1f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""bench_new_game.py - Compares the cost of picking a target word for
+new_game before and after the preloaded dictionary, against a generated
+100k word list.
+
+Usage: python benchmarks/bench_new_game.py [--words N] [--games N]"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hangmanAPI'))
+
+from dictionary import WordDictionary
+
+
+def write_wordlist(path, count):
+    rng = random.Random(1)
+    with open(path, 'w') as f:
+        for _ in range(count):
+            length = rng.randint(3, 14)
+            f.write(''.join(rng.choice(string.ascii_lowercase)
+                            for _ in range(length)) + '\n')
+
+
+def old_pick(path):
+    """The word selection previously done inline by Game.new_game"""
+    return random.choice([line.strip() for line in open(path)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int, default=100000)
+    parser.add_argument('--games', type=int, default=50)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        write_wordlist(path, args.words)
+        old = timeit.timeit(lambda: old_pick(path), number=args.games)
+        load = timeit.timeit(lambda: WordDictionary.from_file(path), number=1)
+        words = WordDictionary.from_file(path)
+        new = timeit.timeit(lambda: words.random_word(1, 10),
+                            number=args.games * 1000) / 1000
+    finally:
+        os.remove(path)
+
+    print('word list:            {} words'.format(args.words))
+    print('before (per game):    {:10.3f} us'.format(old / args.games * 1e6))
+    print('after  (per game):    {:10.3f} us'.format(new / args.games * 1e6))
+    print('after  (one-off load): {:9.3f} ms'.format(load * 1e3))
+    print('speedup:              {:10.1f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
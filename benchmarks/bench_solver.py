@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""bench_solver.py - Builds the solver index and plays every word of the
+list to completion with the real game rules.
+
+Usage: python benchmarks/bench_solver.py [--words N] [--attempts N]
+
+Without --words the bundled wordlist.txt is used; with it, N random words
+are generated."""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'hangmanAPI'))
+
+from dictionary import WordDictionary, WORDLIST_PATH
+from solver import Solver
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--words', type=int)
+    parser.add_argument('--attempts', type=int, default=12)
+    args = parser.parse_args()
+
+    if args.words:
+        rng = random.Random(1)
+        words = WordDictionary(
+            ''.join(rng.choice(string.ascii_lowercase)
+                    for _ in range(rng.randint(3, 14)))
+            for _ in range(args.words))
+    else:
+        words = WordDictionary.from_file(WORDLIST_PATH)
+
+    started = time.time()
+    solver = Solver(words)
+    built = time.time() - started
+
+    started = time.time()
+    won = moves = 0
+    for word in words:
+        result, made = solver.solve(word, args.attempts)
+        won += result
+        moves += made
+    elapsed = time.time() - started
+
+    print('words:            {}'.format(len(words)))
+    print('index build:      {:.3f} s'.format(built))
+    print('solves/sec:       {:.1f}'.format(len(words) / elapsed))
+    print('won:              {} ({:.1%})'.format(won, won / float(len(words))))
+    print('moves per game:   {:.2f}'.format(moves / float(len(words))))
+
+
+if __name__ == '__main__':
+    main()
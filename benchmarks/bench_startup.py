@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""bench_startup.py - Instance startup cost: import time and first request.
+
+Each run starts a clean interpreter that sets up the local App Engine
+service stubs, then times importing main.py and api.py, an optional
+/_ah/warmup request, and the first and second new_game calls. Runs are
+repeated in fresh processes, with and without warmup, and the median of
+each step is reported.
+
+Requires the App Engine Python SDK; pass its location with --sdk or the
+APPENGINE_SDK environment variable.
+
+Usage: python benchmarks/bench_startup.py --sdk PATH [--runs N]"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'hangmanAPI')
+STEPS = ('import_main', 'import_api', 'warmup', 'first_new_game',
+         'second_new_game')
+
+# Runs in the child interpreter; prints one JSON object of step timings (ms)
+CHILD = r'''
+import json, sys, time
+sdk, app_dir, warm = sys.argv[1], sys.argv[2], sys.argv[3] == '1'
+sys.path.insert(0, sdk)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, app_dir)
+from google.appengine.ext import testbed
+bed = testbed.Testbed()
+bed.activate()
+bed.init_datastore_v3_stub()
+bed.init_memcache_stub()
+bed.init_taskqueue_stub(root_path=app_dir)
+timings = {}
+
+def timed(step, fn):
+    started = time.time()
+    result = fn()
+    timings[step] = (time.time() - started) * 1000
+    return result
+
+main = timed('import_main', lambda: __import__('main'))
+api = timed('import_api', lambda: __import__('api'))
+if warm:
+    timed('warmup', lambda: main.app.get_response('/_ah/warmup'))
+service = api.HangmanApi()
+service.create_user(api.USER_REQUEST.combined_message_class(
+    user_name='bench', email='bench@example.com'))
+request = api.NEW_GAME_REQUEST.combined_message_class(user_name='bench')
+timed('first_new_game', lambda: service.new_game(request))
+timed('second_new_game', lambda: service.new_game(request))
+print(json.dumps(timings))
+'''
+
+
+def run_once(sdk, warm):
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD, sdk, APP_DIR, '1' if warm else '0'],
+        cwd=APP_DIR)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'))
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    if not args.sdk:
+        parser.error('the App Engine SDK location is required (--sdk)')
+
+    print('{:<18} {:>12} {:>12}'.format('step (median ms)', 'cold', 'warmed'))
+    results = {}
+    for warm in (False, True):
+        runs = [run_once(args.sdk, warm) for _ in range(args.runs)]
+        results[warm] = dict((step, median([r[step] for r in runs
+                                            if step in r]))
+                             for step in STEPS)
+    for step in STEPS:
+        cells = ['{:>12.1f}'.format(results[warm][step])
+                 if results[warm][step] is not None else '{:>12}'.format('-')
+                 for warm in (False, True)]
+        print('{:<18} {}'.format(step, ' '.join(cells)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""load_test.py - Drives the Hangman endpoints against the local App Engine
+service stubs and reports latency percentiles and RPC counts per endpoint.
+
+Requires the App Engine Python SDK; pass its location with --sdk or the
+APPENGINE_SDK environment variable.
+
+Usage: python benchmarks/load_test.py --sdk PATH [--users N] [--games N]"""
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import random
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'hangmanAPI')
+
+
+def setup_sdk(sdk):
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+
+
+class Recorder(object):
+    """Times endpoint calls and counts the service RPCs each one makes"""
+
+    def __init__(self):
+        self.endpoint = None
+        self.latency = collections.defaultdict(list)
+        self.rpcs = collections.defaultdict(collections.Counter)
+
+    def hook(self, service, call, request, response, *args):
+        if self.endpoint:
+            self.rpcs[self.endpoint]['{}.{}'.format(service, call)] += 1
+
+    def call(self, name, method, request):
+        from google.appengine.ext import ndb
+        # every call is a new request: nothing survives in the context cache
+        ndb.get_context().clear_cache()
+        self.endpoint = name
+        started = time.time()
+        try:
+            return method(request)
+        finally:
+            self.latency[name].append(time.time() - started)
+            self.endpoint = None
+
+    def report(self):
+        print('{:<24} {:>6} {:>9} {:>9} {:>9}  rpcs/call'.format(
+            'endpoint', 'calls', 'p50 ms', 'p99 ms', 'max ms'))
+        for name in sorted(self.latency):
+            samples = sorted(self.latency[name])
+            calls = len(samples)
+            pct = lambda p: samples[min(calls - 1, int(p * calls))] * 1000
+            rpcs = ', '.join('{} {:.1f}'.format(rpc, n / float(calls))
+                             for rpc, n in sorted(self.rpcs[name].items()))
+            print('{:<24} {:>6} {:>9.2f} {:>9.2f} {:>9.2f}  {}'.format(
+                name, calls, pct(0.5), pct(0.99), samples[-1] * 1000,
+                rpcs or '-'))
+
+
+def run(users, games, seed):
+    from google.appengine.api import apiproxy_stub_map
+    from google.appengine.ext import testbed
+    from google.appengine.datastore import datastore_stub_util
+
+    bed = testbed.Testbed()
+    bed.activate()
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1),
+        root_path=APP_DIR)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=APP_DIR)
+    bed.init_mail_stub()
+    bed.init_app_identity_stub()
+
+    import api
+    recorder = Recorder()
+    apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+        'load_test', recorder.hook)
+
+    service = api.HangmanApi()
+    rng = random.Random(seed)
+    user_request = api.USER_REQUEST.combined_message_class
+    page_request = api.PAGE_REQUEST.combined_message_class
+    user_page_request = api.USER_PAGE_REQUEST.combined_message_class
+    new_game_request = api.NEW_GAME_REQUEST.combined_message_class
+    game_request = api.GET_GAME_REQUEST.combined_message_class
+    move_request = api.MAKE_MOVE_REQUEST.combined_message_class
+    names = ['user{}'.format(n) for n in range(users)]
+
+    try:
+        for name in names:
+            recorder.call('create_user', service.create_user,
+                          user_request(user_name=name,
+                                       email=name + '@example.com'))
+        for _ in range(games):
+            name = rng.choice(names)
+            game = recorder.call('new_game', service.new_game,
+                                 new_game_request(user_name=name))
+            key = game.urlsafe_key
+            letters = list('abcdefghijklmnopqrstuvwxyz')
+            rng.shuffle(letters)
+            for letter in letters:
+                game = recorder.call('make_move', service.make_move,
+                                     move_request(urlsafe_game_key=key,
+                                                  guess_letter=letter))
+                if game.game_over:
+                    break
+                if rng.random() < 0.2:
+                    recorder.call('get_game', service.get_game,
+                                  game_request(urlsafe_game_key=key))
+            recorder.call('get_user_games', service.get_user_games,
+                          user_page_request(user_name=name))
+            recorder.call('get_user_scores', service.get_user_scores,
+                          user_page_request(user_name=name))
+            recorder.call('get_scores', service.get_scores, page_request())
+            recorder.call('get_high_scores', service.get_high_scores,
+                          api.GET_HIGH_SCORE_REQUEST.combined_message_class())
+            recorder.call('get_user_rankings', service.get_user_rankings,
+                          page_request())
+    finally:
+        bed.deactivate()
+    recorder.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'))
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    if not args.sdk:
+        parser.error('the App Engine SDK location is required (--sdk)')
+    setup_sdk(args.sdk)
+    run(args.users, args.games, args.seed)
+
+
+if __name__ == '__main__':
+    main()
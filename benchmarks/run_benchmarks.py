@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""run_benchmarks.py - Runs the simulator workloads and checks for regressions.
+
+Absolute moves/sec depend on the machine, so each workload is measured
+relative to a fixed reference loop of plain Python work timed in the same
+process, right before and after it. That ratio is compared with
+benchmarks/baseline.json; the run exits with status 1 if any workload is more
+than --tolerance slower relative to the reference than its baseline. Record a
+new baseline with --update-baseline after an intended change.
+
+Usage: python benchmarks/run_benchmarks.py [--tolerance 0.2]
+                                           [--update-baseline]"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from simulator import report, simulate
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'baseline.json')
+
+# name: (games, strategy); single process so results compare across machines
+# with different core counts
+WORKLOADS = {
+    'random_player': (20000, 'random'),
+    'solver_player': (3000, 'solver'),
+}
+REFERENCE_ROUNDS = 200000
+
+
+def reference():
+    """Times a fixed loop of dict, string and integer work that does not use
+    the app's code. Returns its rounds/sec, the best of three runs."""
+    rng = random.Random(0)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz')
+                     for _ in range(rng.randint(3, 12)))
+             for _ in range(1000)]
+    best = None
+    for _ in range(3):
+        counts = {}
+        started = time.time()
+        for n in range(REFERENCE_ROUNDS):
+            word = words[n % len(words)]
+            mask = 0
+            for letter in word[:4]:
+                mask |= 1 << (ord(letter) - 97)
+            counts[word[0]] = counts.get(word[0], 0) + (mask & 0xff)
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return REFERENCE_ROUNDS / best
+
+
+def run(names):
+    """Returns {name: moves per reference round} for the workloads"""
+    results = {}
+    for name in names:
+        games, strategy = WORKLOADS[name]
+        print('== {} ({} games)'.format(name, games))
+        before = reference()
+        stats = simulate(games, processes=1, strategy=strategy)
+        speed = (before + reference()) / 2
+        report(stats)
+        print('reference:        {:.0f} rounds/sec'.format(speed))
+        results[name] = float('{:.4g}'.format(stats['moves_per_sec'] / speed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown as a fraction of baseline')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = run(sorted(WORKLOADS))
+    if args.update_baseline:
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+            f.write('\n')
+        print('Baseline written to', BASELINE_PATH)
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        sys.exit('No baseline yet, record one with --update-baseline')
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    failed = False
+    print()
+    for name in sorted(results):
+        expected = baseline.get(name)
+        if expected is None:
+            print('{:<15} {:>9.4f} moves/round  (no baseline)'.format(
+                name, results[name]))
+            continue
+        change = float(results[name]) / expected - 1
+        regressed = change < -args.tolerance
+        failed = failed or regressed
+        print('{:<15} {:>9.4f} moves/round  baseline {:>9.4f}  '
+              '{:+.1%}{}'.format(name, results[name], expected, change,
+                                 '  REGRESSION' if regressed else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""simulator.py - Headless hangman simulator.
+
+Plays synthetic games with the real rules from engine.py (letter and word
+guesses, attempts, scoring as in Game.finish) against in-memory storage
+standing in for the datastore: every move loads the stored game state,
+applies the guess and stores it back, like make_move does. Games are spread
+over worker processes, and the run reports moves/sec plus time spent in
+each phase (new game, move, end game).
+
+Usage: python benchmarks/simulator.py [--games N] [--processes N]
+                                      [--strategy random|solver]"""
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'hangmanAPI'))
+
+from dictionary import ALPHABET, get_dictionary
+from engine import Board, play_move, score_guesses
+from solver import get_solver
+
+PHASES = ('new_game', 'move', 'end_game')
+
+
+class MemoryStore(object):
+    """In-memory stand-in for the Game, Move and Score entities"""
+
+    def __init__(self):
+        self.games = {}
+        self.moves = {}
+        self.scores = []
+        self._next_id = 1
+
+    def new_game(self, target_word, attempts):
+        game_id = self._next_id
+        self._next_id += 1
+        self.games[game_id] = {'target_word': target_word, 'guessed_mask': 0,
+                               'attempts_allowed': attempts,
+                               'attempts_remaining': attempts,
+                               'game_over': False}
+        self.moves[game_id] = []
+        return game_id
+
+    def load(self, game_id):
+        return dict(self.games[game_id])
+
+    def save(self, game_id, game, move):
+        self.games[game_id] = game
+        self.moves[game_id].append(move)
+
+    def end_game(self, game_id, won):
+        game = self.games[game_id]
+        game['game_over'] = True
+        self.scores.append((won, score_guesses(game['attempts_allowed'],
+                                               game['attempts_remaining'])))
+        # finished games are not kept, so long runs use constant memory
+        del self.games[game_id]
+        del self.moves[game_id]
+
+
+def _random_guesses(rng):
+    letters = list(ALPHABET)
+    rng.shuffle(letters)
+    return iter(letters)
+
+
+def play_games(count, seed, strategy='random', attempts=12):
+    """Plays count games in this process. Returns a stats dict."""
+    rng = random.Random(seed)
+    words = get_dictionary()
+    solver = get_solver() if strategy == 'solver' else None
+    store = MemoryStore()
+    timings = dict.fromkeys(PHASES, 0.0)
+    moves = wins = 0
+    clock = time.time
+
+    for _ in range(count):
+        started = clock()
+        game_id = store.new_game(words.random_word(), attempts)
+        timings['new_game'] += clock() - started
+        guesses = _random_guesses(rng)
+        while True:
+            started = clock()
+            game = store.load(game_id)
+            board = Board(game['target_word'], game['guessed_mask'])
+            guess_letter = guess_word = None
+            if solver:
+                bits, bucket = solver.candidates(board.pattern,
+                                                 board.guessed_mask)
+                if bits and not bits & (bits - 1):
+                    guess_word = words[bucket.start + bits.bit_length() - 1]
+                else:
+                    guess_letter = solver.best_letter(
+                        board.pattern, board.guessed_mask, bits, bucket)
+            else:
+                guess_letter = next(guesses)
+            result = play_move(board, game['attempts_remaining'],
+                               guess_letter, guess_word)
+            game['guessed_mask'] = board.guessed_mask
+            game['attempts_remaining'] = result.attempts_remaining
+            store.save(game_id, game, (result.guess, result.message))
+            moves += 1
+            timings['move'] += clock() - started
+            if result.game_over:
+                started = clock()
+                store.end_game(game_id, result.won)
+                wins += result.won
+                timings['end_game'] += clock() - started
+                break
+
+    return {'games': count, 'moves': moves, 'wins': wins,
+            'timings': timings}
+
+
+def _worker(args):
+    return play_games(*args)
+
+
+def simulate(games, processes=None, strategy='random', seed=1):
+    """Plays games spread over processes (default: all cores). Returns the
+    combined stats with wall time and moves/sec."""
+    processes = processes or multiprocessing.cpu_count()
+    chunks = [games // processes + (1 if n < games % processes else 0)
+              for n in range(processes)]
+    jobs = [(chunk, seed + n, strategy) for n, chunk in enumerate(chunks)
+            if chunk]
+    started = time.time()
+    if processes == 1:
+        results = [_worker(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_worker, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - started
+
+    total = {'games': 0, 'moves': 0, 'wins': 0,
+             'timings': dict.fromkeys(PHASES, 0.0)}
+    for result in results:
+        for key in ('games', 'moves', 'wins'):
+            total[key] += result[key]
+        for phase in PHASES:
+            total['timings'][phase] += result['timings'][phase]
+    total['processes'] = processes
+    total['seconds'] = elapsed
+    total['moves_per_sec'] = total['moves'] / elapsed if elapsed else 0.0
+    return total
+
+
+def report(stats):
+    print('games:            {} ({} won)'.format(stats['games'],
+                                                  stats['wins']))
+    print('moves:            {}'.format(stats['moves']))
+    print('processes:        {}'.format(stats['processes']))
+    print('wall time:        {:.2f} s'.format(stats['seconds']))
+    print('moves/sec:        {:.0f}'.format(stats['moves_per_sec']))
+    busy = sum(stats['timings'].values()) or 1.0
+    for phase in PHASES:
+        seconds = stats['timings'][phase]
+        calls = stats['moves'] if phase == 'move' else stats['games']
+        print('  {:<15} {:8.2f} s  {:5.1%}  {:7.2f} us/call'.format(
+            phase, seconds, seconds / busy,
+            seconds / calls * 1e6 if calls else 0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--strategy', choices=('random', 'solver'),
+                        default='random')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    report(simulate(args.games, args.processes, args.strategy, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,28 +9,105 @@ import logging
 import endpoints
 import random
 from protorpc import remote, messages
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
 
-from models import User, Game, Score
+from google.appengine.ext import ndb
+
+from models import User, UserStats, Game, Move, ArchivedGame
 from models import StringMessage, NewGameForm, GameForm, MakeMoveForm,\
     ScoreForms, GameListForm, GameListForms, UserRankForm, UserRankForms, \
-    GameHistoryForm
-
-from utils import get_by_urlsafe
+    GameHistoryForm, CacheStatsForm, MakeMovesForm, MoveResultForm, \
+    MakeMovesResultForm, BulkMovesForm, BulkMovesResultForm, HintForm, \
+    RequestStatsForm, RequestStatsForms, RpcStatsForm, LatencyBucketForm
+
+from utils import get_cursor, key_from_urlsafe, page_size
+from cache import ContentionError, game_cache
+import counters
+import leaderboard
+import scores
+from solver import get_solver, popcount
+import profiling
+from profiling import instrumented
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(NewGameForm)
 GET_GAME_REQUEST = endpoints.ResourceContainer(
         urlsafe_game_key=messages.StringField(1),)
 GET_HIGH_SCORE_REQUEST = endpoints.ResourceContainer(
-     limit=messages.IntegerField(1))
+     limit=messages.IntegerField(1),
+     window=messages.StringField(2))
+GET_GAME_HISTORY_REQUEST = endpoints.ResourceContainer(
+        urlsafe_game_key=messages.StringField(1),
+        limit=messages.IntegerField(2),
+        cursor=messages.StringField(3),)
+PAGE_REQUEST = endpoints.ResourceContainer(
+        limit=messages.IntegerField(1),
+        cursor=messages.StringField(2),)
+USER_PAGE_REQUEST = endpoints.ResourceContainer(
+        user_name=messages.StringField(1),
+        limit=messages.IntegerField(2),
+        cursor=messages.StringField(3),)
 MAKE_MOVE_REQUEST = endpoints.ResourceContainer(
     MakeMoveForm,
     urlsafe_game_key=messages.StringField(1),)
+MAKE_MOVES_REQUEST = endpoints.ResourceContainer(
+    MakeMovesForm,
+    urlsafe_game_key=messages.StringField(1),)
 USER_REQUEST = endpoints.ResourceContainer(user_name=messages.StringField(1),
                                            email=messages.StringField(2))
+REQUEST_STATS_REQUEST = endpoints.ResourceContainer(
+        name=messages.StringField(1),)
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+LIST_PAGE_SIZE = 50
+MAX_LIST_PAGE_SIZE = 200
+MAX_BATCH_MOVES = 100
+HINT_WORDS = 10
+MAX_BULK_GAMES = 50
+RANKINGS_PAGE_SIZE = 25
+MAX_RANKINGS_PAGE_SIZE = 100
+
+
+def _mover(moves, strict=True):
+    """Returns a game_cache mutate function that plays moves (MakeMoveForms)
+    in order until the game is over. Its result is a list of MoveResultForms.
+    An illegal guess raises ValueError if strict, otherwise it is reported as
+    the last result."""
+    def mutate(game):
+        if game.game_over:
+            return [MoveResultForm(message='Game already over!',
+                                   attempts_remaining=game.attempts_remaining,
+                                   game_over=True)], None
+        results, entities = [], []
+        for move in moves:
+            if game.game_over:
+                break
+            try:
+                result = game.make_move(move.guess_letter, move.guess_word)
+            except ValueError as e:
+                if strict:
+                    raise
+                results.append(MoveResultForm(
+                    message=str(e), attempts_remaining=game.attempts_remaining,
+                    game_over=False))
+                break
+            results.append(MoveResultForm(
+                guess=result.guess, message=result.message,
+                attempts_remaining=game.attempts_remaining,
+                game_over=result.game_over))
+            if not result.changed:
+                # illegal move, e.g. letter already guessed - nothing to save
+                continue
+            # The new Move log entry (and the Score once the game is over)
+            # are saved with the game in its transaction, see cache.py
+            entities.append(game.record_move(result))
+            if result.game_over:
+                entities.append(game.finish(result.won))
+        if not results:
+            results.append(MoveResultForm(
+                message='No moves given!',
+                attempts_remaining=game.attempts_remaining, game_over=False))
+        return results, entities or None
 
-MEMCACHE_MOVES_REMAINING = 'MOVES_REMAINING'
 
 ### Add on one player hangman API
 @endpoints.api(name='hangman', version='v1')
@@ -41,13 +118,13 @@ class HangmanApi(remote.Service):
                       path='user',
                       name='create_user',
                       http_method='POST')
+    @instrumented
     def create_user(self, request):
         """Create a User. Requires a unique username"""
-        if User.query(User.name == request.user_name).get():
-            raise endpoints.ConflictException(
-                    'A User with that name already exists!')
-        user = User(name=request.user_name, email=request.email)
-        user.put()
+        try:
+            User.create(request.user_name, request.email)
+        except ValueError as e:
+            raise endpoints.ConflictException(str(e))
         return StringMessage(message='User {} created!'.format(
                 request.user_name))
 
@@ -56,24 +133,20 @@ class HangmanApi(remote.Service):
                       path='game',
                       name='new_game',
                       http_method='POST')
-    
+    @instrumented
     def new_game(self, request):
         """Creates new game"""
-        user = User.query(User.name == request.user_name).get()
+        user = User.get_by_name(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
+        # The average attempts remaining counters are updated by tasks queued
+        # as the game is saved.
         try:
             game = Game.new_game(user.key, request.min,
                                  request.max, request.attempts)
-        except ValueError:
-            raise endpoints.BadRequestException('Maximum must be greater '
-                                                'than minimum!')
-
-        # Use a task queue to update the average attempts remaining.
-        # This operation is not needed to complete the creation of a new game
-        # so it is performed out of sequence.
-        taskqueue.add(url='/tasks/cache_average_attempts')
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
         return game.to_form('Good luck playing Hangman!')
 
     ## Add in cancel game request
@@ -83,13 +156,17 @@ class HangmanApi(remote.Service):
                       path='game/cancel/{urlsafe_game_key}',
                       name='cancel_game',
                       http_method='PUT')
-    
+    @instrumented
     def cancel_game(self, request):
         """Cancel playing game."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        key = key_from_urlsafe(request.urlsafe_game_key)
+        if key.kind() != Game._get_kind():
+            raise endpoints.BadRequestException('Incorrect Kind')
+        # decided on the game as stored, not a cached copy
+        game = Game.cancel(key)
         if game:
             if(game.game_over == False):
-                game.key.delete()
+                game_cache.delete(request.urlsafe_game_key)
                 return StringMessage(message="Game cancelled.")
             else:
                 return StringMessage(message="Cannot delete already completed game.")
@@ -101,136 +178,187 @@ class HangmanApi(remote.Service):
                       path='game/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @instrumented
     def get_game(self, request):
         """Return the current game state."""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        game = game_cache.get(request.urlsafe_game_key)
         if game:
             return game.to_form('Time to make a move!')
-        else:
-            raise endpoints.NotFoundException('Game not found!')
+        archived = ArchivedGame.for_game_key(
+            ndb.Key(urlsafe=request.urlsafe_game_key))
+        if archived:
+            return archived.to_form('Game archived.')
+        raise endpoints.NotFoundException('Game not found!')
 
     @endpoints.method(request_message=MAKE_MOVE_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='make_move',
                       http_method='PUT')
-    
+    @instrumented
     def make_move(self, request):
         """Makes a move. Returns a game state with message"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game.game_over:
-            return game.to_form('Game already over!')
-
-        ## set-up history of message string
-        if game.history is None:
-          history = []
-
-        if request.guess_word == game.target_word:
-            game.end_game(True)
-            game.history = str(game.history) + ' ' + str([request.guess_word, 'You Win!'])
-            game.put()
-            return game.to_form('You win!')
-
-        if request.guess_word is not None:
-            game.history = str(game.history) + ' ' + str([request.guess_word, 'Incorrect Guess!'])
-            game.attempts_remaining -= 1
-            game.put()
-            return game.to_form('Incorrect Guess!')
-
-        # need to breakdown target_word into individual strings
-        # did this by splitting a string into an array
-        # http://stackoverflow.com/questions/113655/is-there-a-function-in-python-to-split-a-word-into-a-list
-
-        # create string of previously guessed letters
-        string_guessed_letter = request.guess_letter.encode('UTF8')
-
-        # check illegal move if letter was guessed already
-        if game.guessed_letters is not None:
-          if string_guessed_letter in game.guessed_letters:
-            return game.to_form('Letter already guessed!')
-
-
-        # attempts will only be decreased if no letter found in target_word
-        if request.guess_letter[0] not in game.target_word:
-          game.attempts_remaining -= 1
-
-        # add new guest letter to string
-        if game.guessed_letters is None:
-          game.guessed_letters = string_guessed_letter
-        else:
-          game.guessed_letters= str(game.guessed_letters) + string_guessed_letter
-        game.put()
-               
-        # need to print out the hangman board
-        strip_unicode_letter_history = [str(x) for x in game.guessed_letters]
-
-        print_hint = [str(x) for x in game.target_word]
-        show_hint = []
-
-        for i in range(len(print_hint)):
-          for x in range(len(strip_unicode_letter_history)):
-            if x == max(range(len(strip_unicode_letter_history))):
-              if strip_unicode_letter_history[x] == print_hint[i]:
-                show_hint.append(strip_unicode_letter_history[x])
-              else:
-                show_hint.append('_')
-            elif strip_unicode_letter_history[x] == print_hint[i]:
-              show_hint.append(strip_unicode_letter_history[x])
-              break
+        try:
+            game, results = game_cache.update(request.urlsafe_game_key,
+                                              _mover([request]))
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+        except ContentionError as e:
+            raise endpoints.ConflictException(str(e))
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
+        return game.to_form(results[-1].message)
 
-        msg = ' '.join(show_hint)
+    @endpoints.method(request_message=MAKE_MOVES_REQUEST,
+                      response_message=MakeMovesResultForm,
+                      path='game/{urlsafe_game_key}/moves',
+                      name='make_moves',
+                      http_method='POST')
+    @instrumented
+    def make_moves(self, request):
+        """Makes an ordered list of moves, stopping at game over. The game is
+        read and written once. Returns the game state and per-move results"""
+        if len(request.moves) > MAX_BATCH_MOVES:
+            raise endpoints.BadRequestException(
+                'At most {} moves per request!'.format(MAX_BATCH_MOVES))
+        try:
+            game, results = game_cache.update(
+                request.urlsafe_game_key, _mover(request.moves, strict=False))
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+        except ContentionError as e:
+            raise endpoints.ConflictException(str(e))
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
+        return MakeMovesResultForm(game=game.to_form(results[-1].message),
+                                   results=results)
 
-        game.history = str(game.history) + ' ' + str([string_guessed_letter,msg])
-        game.put()
+    @endpoints.method(request_message=BulkMovesForm,
+                      response_message=BulkMovesResultForm,
+                      path='games/moves',
+                      name='bulk_make_moves',
+                      http_method='POST')
+    @instrumented
+    def bulk_make_moves(self, request):
+        """Makes moves in many games at once, each game in its own
+        transaction, all running concurrently. A game that does not exist
+        is returned as an error with only its key; a game whose moves could
+        not be saved is returned unchanged with an error, without affecting
+        the others"""
+        if len(request.items) > MAX_BULK_GAMES:
+            raise endpoints.BadRequestException(
+                'At most {} games per request!'.format(MAX_BULK_GAMES))
+        mutations = {}
+        for item in request.items:
+            if len(item.moves) > MAX_BATCH_MOVES:
+                raise endpoints.BadRequestException(
+                    'At most {} moves per game!'.format(MAX_BATCH_MOVES))
+            if item.urlsafe_game_key in mutations:
+                raise endpoints.BadRequestException(
+                    'Each game may only appear once!')
+            mutations[item.urlsafe_game_key] = _mover(item.moves,
+                                                      strict=False)
+        try:
+            played, errors = game_cache.update_multi(mutations)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+        forms = {}
+        for key, (game, results) in played.items():
+            # the users of all games are read concurrently
+            forms[key] = (game.to_form_async(results[-1].message), results,
+                          None)
+        for key, error in errors.items():
+            if isinstance(error, ContentionError):
+                message = str(error)
+            else:
+                logging.error('Moves in game %s failed: %r', key, error)
+                message = 'The moves could not be saved, try again!'
+            game = game_cache.get(key)
+            if game:
+                forms[key] = (game.to_form_async(message), [], message)
+        items = []
+        for item in request.items:
+            key = item.urlsafe_game_key
+            if key in forms:
+                form, results, error = forms[key]
+                items.append(MakeMovesResultForm(game=form.get_result(),
+                                                 results=results, error=error,
+                                                 urlsafe_game_key=key))
+            else:
+                items.append(MakeMovesResultForm(error='Game not found!',
+                                                 urlsafe_game_key=key))
+        return BulkMovesResultForm(items=items)
 
-        if game.attempts_remaining < 1:
-            game.end_game(False)
-            game.history = str(game.history) + ' ' + str([msg + '  Game over!'])
-            game.put()
-            return game.to_form(msg + '  Game over!')
-        else:
-            game.put()
-            return game.to_form(msg)
+    @endpoints.method(request_message=GET_GAME_REQUEST,
+                      response_message=HintForm,
+                      path='game/{urlsafe_game_key}/hint',
+                      name='get_hint',
+                      http_method='GET')
+    @instrumented
+    def get_hint(self, request):
+        """Return the best letter to guess next and the words still possible"""
+        game = game_cache.get(request.urlsafe_game_key)
+        if not game:
+            raise endpoints.NotFoundException('Game not found!')
+        if game.game_over:
+            raise endpoints.BadRequestException('Game already over!')
+        board = game.board()
+        hints = get_solver()
+        bits, bucket = hints.candidates(board.pattern, board.guessed_mask)
+        return HintForm(
+            letter=hints.best_letter(board.pattern, board.guessed_mask,
+                                     bits, bucket),
+            candidates=popcount(bits),
+            words=hints.candidate_words(board.pattern, board.guessed_mask,
+                                        HINT_WORDS))
 
     ## Add in get_user_games
-    @endpoints.method(request_message=USER_REQUEST,
+    @endpoints.method(request_message=USER_PAGE_REQUEST,
                       response_message=GameListForms,
                       path='games/user/{user_name}',
                       name='get_user_games',
                       http_method='GET')
+    @instrumented
     def get_user_games(self, request):
-        """Returns all of an individual User's games."""
-        user = User.query(User.name == request.user_name).get()
-        if not user:
+        """Returns a page of an individual User's active games."""
+        user_key = User.key_for_name(request.user_name)
+        if not user_key:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
-        games = Game.query(Game.user == user.key)
+        games = Game.query(Game.user == user_key)
         games = games.filter(Game.game_over == False)
-        return GameListForms(items=[game.to_gamelistform() for game in games])
-
-
-    @endpoints.method(response_message=ScoreForms,
+        # only the keys are returned, so no entities need to be read
+        keys, cursor, more = games.fetch_page(
+            page_size(request.limit, LIST_PAGE_SIZE, MAX_LIST_PAGE_SIZE),
+            start_cursor=get_cursor(request.cursor), keys_only=True)
+        return GameListForms(
+            items=[GameListForm(urlsafe_key=key.urlsafe()) for key in keys],
+            next_cursor=cursor.urlsafe() if more and cursor else None)
+
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @instrumented
     def get_scores(self, request):
-        """Return all scores"""
-        return ScoreForms(items=[score.to_form() for score in Score.query()])
+        """Return a page of all scores"""
+        return scores.all_scores(request.limit, request.cursor).to_forms()
 
-    @endpoints.method(request_message=USER_REQUEST,
+    @endpoints.method(request_message=USER_PAGE_REQUEST,
                       response_message=ScoreForms,
                       path='scores/user/{user_name}',
                       name='get_user_scores',
                       http_method='GET')
-
+    @instrumented
     def get_user_scores(self, request):
-        """Returns all of an individual User's scores"""
-        user = User.query(User.name == request.user_name).get()
-        if not user:
+        """Returns a page of an individual User's scores"""
+        user_key = User.key_for_name(request.user_name)
+        if not user_key:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
-        scores = Score.query(Score.user == user.key)
-        return ScoreForms(items=[score.to_form() for score in scores])
+        return scores.user_scores(user_key, request.limit,
+                                  request.cursor).to_forms()
 
     ## Add in get_high_scores
     @endpoints.method(request_message=GET_HIGH_SCORE_REQUEST,
@@ -238,59 +366,143 @@ class HangmanApi(remote.Service):
                       path='high_scores',
                       name='get_high_scores',
                       http_method='GET')
+    @instrumented
     def get_high_scores(self, request):
-        """Return high scores"""
-        scores = Score.query(Score.won == True).order(Score.guesses)
-        scores = scores.fetch(limit=request.limit);
-        return ScoreForms(items=[score.to_form() for score in scores])
+        """Return high scores of all time, today or this week"""
+        try:
+            return scores.high_scores(request.limit,
+                                      request.window).to_forms()
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
 
     ## Add in get_user_rankings
-    @endpoints.method(response_message=UserRankForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=UserRankForms,
                       path='user_rankings',
                       name='get_user_rankings',
                       http_method='GET')
+    @instrumented
     def get_user_rankings(self, request):
-        """Return User Rankings"""    
-        ## For each user, calculate their win/loss ratio
-        ## use the average number of guesses per game as tiebreaker
-        #users = User.query().order(User.performance).fetch()
-        users = User.query()
-        # create list out of user and performance output, appended guesses
-        return UserRankForms(items=[user.to_form() for user in users])
+        """Return User Rankings, a page of the materialized leaderboard"""
+        ## Users are ranked by win/loss ratio with the average number of
+        ## guesses per game as tiebreaker, see leaderboard.py
+        snapshot = leaderboard.current_snapshot()
+        if snapshot is None:
+            leaderboard.request_refresh()
+            return UserRankForms(items=[])
+        try:
+            offset = max(int(request.cursor or 0), 0)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid Cursor')
+        limit = page_size(request.limit, RANKINGS_PAGE_SIZE,
+                          MAX_RANKINGS_PAGE_SIZE)
+        entries = leaderboard.get_page(snapshot, offset, limit)
+        items = [UserRankForm(user=name, ratio=ratio, average_guesses=guesses,
+                              rank=rank)
+                 for rank, (name, ratio, guesses)
+                 in enumerate(entries, offset + 1)]
+        more = offset + len(entries) < snapshot.total
+        return UserRankForms(items=items,
+                             next_cursor=str(offset + limit) if more else None)
+
+    @endpoints.method(request_message=USER_REQUEST,
+                      response_message=UserRankForm,
+                      path='user_rankings/user/{user_name}',
+                      name='get_user_rank',
+                      http_method='GET')
+    @instrumented
+    def get_user_rank(self, request):
+        """Return a User's rank in the latest leaderboard"""
+        user = User.get_by_name(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                    'A User with that name does not exist!')
+        # the stats shards and the rank are independent reads
+        stats = UserStats.totals_async([user])
+        rank = leaderboard.get_rank_async(user)
+        form = user.to_form(stats.get_result()[user.key])
+        form.rank = rank.get_result()
+        return form
 
     ## Add in get_game_history
-    @endpoints.method(request_message=GET_GAME_REQUEST,
+    @endpoints.method(request_message=GET_GAME_HISTORY_REQUEST,
                       response_message=GameHistoryForm,
                       path='game_history',
                       name='get_game_history',
                       http_method='GET')
+    @instrumented
     def get_game_history(self, request):
-        """Return Game History"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        return GameHistoryForm(history=game.history)
-        for u in users:
-          scores = Score.query(Score.user == u.key).fetch
-          tot_guesses = sum([score.guesses for score in scores])
+        """Return Game History, a page of moves in the order they were made"""
+        game = game_cache.get(request.urlsafe_game_key)
+        if not game:
+            # archived games return their whole log in one page
+            archived = ArchivedGame.for_game_key(
+                ndb.Key(urlsafe=request.urlsafe_game_key))
+            if not archived:
+                raise endpoints.NotFoundException('Game not found!')
+            return GameHistoryForm(items=archived.move_forms())
+        moves, cursor, more = Move.query(ancestor=game.key).order(
+            Move.key).fetch_page(
+                page_size(request.limit, HISTORY_PAGE_SIZE,
+                          MAX_HISTORY_PAGE_SIZE),
+                start_cursor=get_cursor(request.cursor))
+        return GameHistoryForm(
+            items=[move.to_form() for move in moves],
+            next_cursor=cursor.urlsafe() if more and cursor else None)
+
+    @endpoints.method(response_message=CacheStatsForm,
+                      path='stats/game_cache',
+                      name='get_game_cache_stats',
+                      http_method='GET')
+    @instrumented
+    def get_game_cache_stats(self, request):
+        """Return this instance's game cache counters"""
+        stats = game_cache.stats()
+        latency = stats.pop('latency_ms')
+        return CacheStatsForm(get_ms=latency['get'],
+                              update_ms=latency['update'], **stats)
+
+    @endpoints.method(request_message=REQUEST_STATS_REQUEST,
+                      response_message=RequestStatsForms,
+                      path='stats/requests',
+                      name='get_request_stats',
+                      http_method='GET')
+    def get_request_stats(self, request):
+        """Return this instance's wall time histograms and datastore/memcache
+        RPC counts per endpoint and task handler, optionally for one name"""
+        items = []
+        for name, stats in sorted(profiling.stats(request.name).items()):
+            bounds = profiling.LATENCY_BUCKETS_MS + (None,)
+            items.append(RequestStatsForm(
+                name=name, calls=stats.calls, errors=stats.errors,
+                mean_ms=stats.total_ms / stats.calls,
+                p50_ms=stats.percentile(0.5), p99_ms=stats.percentile(0.99),
+                max_ms=stats.max_ms,
+                histogram=[LatencyBucketForm(max_ms=bound, count=count)
+                           for bound, count in zip(bounds, stats.histogram)],
+                rpcs=[RpcStatsForm(rpc=rpc, calls=calls,
+                                   per_request=float(calls) / stats.calls,
+                                   bytes_sent=sent, bytes_received=received)
+                      for rpc, (calls, sent, received)
+                      in sorted(stats.rpcs.items())],
+                profiles=list(stats.profiles)))
+        return RequestStatsForms(items=items)
 
     @endpoints.method(response_message=StringMessage,
                       path='games/average_attempts',
                       name='get_average_attempts_remaining',
                       http_method='GET')
+    @instrumented
     def get_average_attempts(self, request):
-        """Get the cached average moves remaining"""
-        return StringMessage(message=memcache.get(MEMCACHE_MOVES_REMAINING) or '')
-
-    @staticmethod
-    def _cache_average_attempts():
-        """Populates memcache with the average moves remaining of Games"""
-        games = Game.query(Game.game_over == False).fetch()
-        if games:
-            count = len(games)
-            total_attempts_remaining = sum([game.attempts_remaining
-                                        for game in games])
-            average = float(total_attempts_remaining)/count
-            memcache.set(MEMCACHE_MOVES_REMAINING,
-                         'The average moves remaining is {:.2f}'.format(average))
+        """Get the average moves remaining of active games"""
+        counts = counters.get_counts([counters.ACTIVE_GAMES,
+                                      counters.ATTEMPTS_REMAINING])
+        if counts[counters.ACTIVE_GAMES] < 1:
+            return StringMessage(message='')
+        average = (float(counts[counters.ATTEMPTS_REMAINING]) /
+                   counts[counters.ACTIVE_GAMES])
+        return StringMessage(
+            message='The average moves remaining is {:.2f}'.format(average))
 
 
 api = endpoints.api_server([HangmanApi])
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""archive.py - Archival of finished games and expiry of abandoned ones.
+
+A daily cron starts two chains of taskqueue tasks, each reading one page of
+game keys per task and queueing the next page with the query cursor:
+
+- games over for longer than ARCHIVE_AFTER_HOURS are replaced by a compact
+  ArchivedGame holding the target word and the compressed move log, and the
+  Game and its Moves are deleted;
+- unfinished games without a move for GAME_TTL_DAYS are deleted with their
+  Moves, and tasks queued in the same transaction reduce the active games
+  counters accordingly.
+
+Each game is handled in its own transaction that re-checks it, so a move made
+while the task runs wins over the cleanup. Both delays can be set in app.yaml
+env_variables."""
+
+import calendar
+import logging
+import os
+from datetime import datetime, timedelta
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Game, Move, ArchivedGame
+from cache import game_cache
+from utils import add_tasks
+import counters
+
+ARCHIVE_URL = '/tasks/archive_games'
+EXPIRE_URL = '/tasks/expire_games'
+BATCH_SIZE = 100
+ARCHIVE_AFTER = timedelta(hours=float(os.environ.get('ARCHIVE_AFTER_HOURS',
+                                                     24)))
+GAME_TTL = timedelta(days=float(os.environ.get('GAME_TTL_DAYS', 14)))
+
+
+def start():
+    """Queues the first archive and expire tasks. The cutoffs are fixed for
+    the whole run."""
+    now = datetime.utcnow()
+    taskqueue.add(url=ARCHIVE_URL,
+                  params={'cutoff': _timestamp(now - ARCHIVE_AFTER)})
+    taskqueue.add(url=EXPIRE_URL,
+                  params={'cutoff': _timestamp(now - GAME_TTL)})
+
+
+def _timestamp(when):
+    return '{:.6f}'.format(calendar.timegm(when.timetuple()) +
+                           when.microsecond / 1e6)
+
+
+def _datetime(timestamp):
+    return datetime.utcfromtimestamp(float(timestamp))
+
+
+def _page(url, game_over, cutoff, cursor):
+    """Returns one page of keys of games last written before cutoff, after
+    queueing the task for the next page."""
+    keys, next_cursor, more = Game.query(
+        Game.game_over == game_over,
+        Game.last_move < _datetime(cutoff)).fetch_page(
+            BATCH_SIZE, keys_only=True,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+    if more and next_cursor:
+        taskqueue.add(url=url, params={'cutoff': cutoff,
+                                       'cursor': next_cursor.urlsafe()})
+    return keys
+
+
+def _idle(game, cutoff):
+    return game.last_move is None or game.last_move < cutoff
+
+
+@ndb.transactional_tasklet(xg=True)
+def _archive(key, cutoff):
+    game = yield key.get_async()
+    if not game or not game.game_over or not _idle(game, cutoff):
+        raise ndb.Return(False)
+    moves = yield Move.query(ancestor=key).order(Move.key).fetch_async()
+    yield ArchivedGame.from_game(game, moves).put_async(), \
+        ndb.delete_multi_async([key] + [move.key for move in moves])
+    raise ndb.Return(True)
+
+
+def archive(cutoff, cursor=None):
+    """Archives one page of games finished before cutoff (a timestamp)"""
+    keys = _page(ARCHIVE_URL, True, cutoff, cursor)
+    when = _datetime(cutoff)
+    futures = [_archive(key, when) for key in keys]
+    archived = [key for key, future in zip(keys, futures)
+                if future.get_result()]
+    for key in archived:
+        game_cache.delete(key.urlsafe())
+    logging.info('Archived %d of %d finished games', len(archived), len(keys))
+
+
+@ndb.transactional_tasklet
+def _expire(key, cutoff):
+    game = yield key.get_async()
+    if not game or game.game_over or not _idle(game, cutoff):
+        raise ndb.Return(None)
+    moves = yield Move.query(ancestor=key).fetch_async(keys_only=True)
+    add_tasks(counters.increment_tasks({
+        counters.ACTIVE_GAMES: -1,
+        counters.ATTEMPTS_REMAINING: -game.attempts_remaining}))
+    yield ndb.delete_multi_async([key] + moves)
+    raise ndb.Return(game)
+
+
+def expire(cutoff, cursor=None):
+    """Deletes one page of unfinished games idle since before cutoff (a
+    timestamp)"""
+    keys = _page(EXPIRE_URL, False, cutoff, cursor)
+    when = _datetime(cutoff)
+    futures = [_expire(key, when) for key in keys]
+    expired = [game for game in [f.get_result() for f in futures] if game]
+    for game in expired:
+        game_cache.delete(game.key.urlsafe())
+    logging.info('Expired %d of %d idle games', len(expired), len(keys))
@@ -0,0 +1,258 @@
+"""cache.py - Read-through cache of games with transactional updates.
+
+A Game is a root entity and its Moves are its children, so every game is an
+entity group of its own and moves on different games never contend. Moves
+are applied in a datastore transaction: it reads the game, applies the move,
+bumps Game.version and writes the game with its new Move entries in one
+commit. The work on other entity groups - the active games counters and the
+Score of a finished game - is queued as tasks in the same transaction, so it
+happens exactly when the move commits and is retried until it succeeds.
+Concurrent moves on the same game make all but one transaction fail; those
+are retried with fresh data up to TXN_RETRIES times, with exponential backoff
+and jitter, so no move is lost or applied to a stale game.
+
+Committed games are written to memcache, keyed by the game's urlsafe key,
+with CAS: a version older than the one already cached is never written, and
+a conflicting write drops the entry so the next read reloads it. Entries
+expire after CACHE_SECONDS in any case. Each instance also keeps a small LRU
+of recently seen games for reads."""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from google.appengine.api import datastore_errors, memcache
+from google.appengine.ext import ndb
+
+from models import Game, Score
+from utils import add_tasks, get_by_urlsafe, key_from_urlsafe
+import counters
+
+NAMESPACE = 'game'
+CACHE_SECONDS = 3600
+LRU_SIZE = 500
+# Seconds a local LRU entry may serve reads before memcache is consulted.
+LOCAL_TTL = 2
+TXN_RETRIES = 5
+# Seconds before the first retry of a conflicting move; doubles every retry.
+BACKOFF = 0.02
+
+
+class ContentionError(Exception):
+    """A move could not be committed within TXN_RETRIES attempts"""
+
+
+class GameCache(object):
+    """Game cache. See the module docstring for the policy."""
+
+    def __init__(self, lru_size=LRU_SIZE, local_ttl=LOCAL_TTL,
+                 client_factory=memcache.Client):
+        self.lru_size = lru_size
+        self.local_ttl = local_ttl
+        self._client_factory = client_factory
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ['local_hits', 'memcache_hits', 'misses', 'updates', 'retries',
+             'evictions'], 0)
+        self._latency = {'get': [0, 0.0], 'update': [0, 0.0]}
+
+    # -- local LRU -------------------------------------------------------
+
+    def _remember(self, urlsafe, game):
+        with self._lock:
+            self._lru.pop(urlsafe, None)
+            self._lru[urlsafe] = (time.time(), game)
+            evicted = 0
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+                evicted += 1
+            self._counters['evictions'] += evicted
+
+    def _recall(self, urlsafe):
+        with self._lock:
+            entry = self._lru.get(urlsafe)
+            if entry and time.time() - entry[0] <= self.local_ttl:
+                self._lru[urlsafe] = self._lru.pop(urlsafe)
+                return entry[1]
+        return None
+
+    def _forget(self, urlsafe):
+        with self._lock:
+            self._lru.pop(urlsafe, None)
+
+    # -- counters --------------------------------------------------------
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _timed(self, op, started):
+        with self._lock:
+            self._latency[op][0] += 1
+            self._latency[op][1] += time.time() - started
+
+    def stats(self):
+        """Returns hit rate, counters and mean latency (ms) per operation"""
+        with self._lock:
+            stats = dict(self._counters)
+            latency = dict((op, 1000 * total / calls if calls else 0.0)
+                           for op, (calls, total) in self._latency.items())
+        reads = stats['local_hits'] + stats['memcache_hits'] + stats['misses']
+        stats['hit_rate'] = (float(reads - stats['misses']) / reads
+                             if reads else 0.0)
+        stats['latency_ms'] = latency
+        return stats
+
+    # -- games -----------------------------------------------------------
+
+    def get(self, urlsafe):
+        """Returns the current Game for urlsafe, or None if it does not exist.
+        Raises the same errors as utils.get_by_urlsafe for bad keys."""
+        started = time.time()
+        try:
+            game = self._recall(urlsafe)
+            if game is not None:
+                self._count('local_hits')
+                return game
+            client = self._client_factory()
+            game = client.get(urlsafe, namespace=NAMESPACE)
+            if game is not None:
+                self._count('memcache_hits')
+            else:
+                self._count('misses')
+                game = get_by_urlsafe(urlsafe, Game)
+                if game is None:
+                    return None
+                client.add(urlsafe, game, time=CACHE_SECONDS,
+                           namespace=NAMESPACE)
+            self._remember(urlsafe, game)
+            return game
+        finally:
+            self._timed('get', started)
+
+    def update(self, urlsafe, mutate):
+        """Applies mutate to a game in a transaction.
+
+        mutate(game) is called with the game as stored on every attempt and
+        returns (result, entities): entities is a list of new entities to
+        save with the game, or None if the game was not changed. Scores among
+        them, and the changes to the active games counters, are recorded by
+        tasks queued with the move. Returns
+        (game, result), or (None, None) if the game does not exist. Raises
+        ContentionError if the move kept conflicting with others."""
+        results, errors = self.update_multi({urlsafe: mutate})
+        if urlsafe in errors:
+            raise errors[urlsafe]
+        return results.get(urlsafe, (None, None))
+
+    def update_multi(self, mutations):
+        """Applies {urlsafe: mutate} to several games, each in its own
+        transaction, all running concurrently. See update. Returns
+        ({urlsafe: (game, result)}, {urlsafe: error}): the games played,
+        leaving out games that do not exist, and the exception of each game
+        whose transaction failed, e.g. ContentionError. A failed game does
+        not affect the others. Raises ValueError, before any game is played,
+        if a key is not a Game key."""
+        started = time.time()
+        try:
+            keys = dict((urlsafe, key_from_urlsafe(urlsafe))
+                        for urlsafe in mutations)
+            for key in keys.values():
+                if key.kind() != Game._get_kind():
+                    raise ValueError('Incorrect Kind')
+            futures = dict((urlsafe, self._update_async(keys[urlsafe],
+                                                        mutate))
+                           for urlsafe, mutate in mutations.items())
+            results, errors, changed = {}, {}, {}
+            for urlsafe, future in futures.items():
+                try:
+                    outcome = future.get_result()
+                except Exception as e:
+                    errors[urlsafe] = e
+                    continue
+                if outcome is None:
+                    continue
+                game, result, saved = outcome
+                results[urlsafe] = (game, result)
+                if saved:
+                    changed[urlsafe] = game
+                self._remember(urlsafe, game)
+            self._count('updates', len(changed))
+            self._store_multi(changed)
+            return results, errors
+        finally:
+            self._timed('update', started)
+
+    @ndb.tasklet
+    def _update_async(self, key, mutate):
+        """Returns (game, result, saved) for one game, or None if it does not
+        exist."""
+        @ndb.tasklet
+        def txn():
+            game = yield key.get_async()
+            if game is None:
+                raise ndb.Return(None)
+            attempts_before = game.attempts_remaining
+            # the move log of a game stored before Move existed comes first
+            legacy = game.upgrade()
+            result, entities = mutate(game)
+            if entities is None:
+                raise ndb.Return((game, result, False))
+            game.version = (game.version or 0) + 1
+            # Scores and counters belong to other entity groups
+            tasks = counters.increment_tasks(
+                game.counter_deltas(attempts_before))
+            tasks += [e.record_task() for e in entities
+                      if isinstance(e, Score)]
+            if tasks:
+                add_tasks(tasks)
+            yield ndb.put_multi_async(
+                [game] + legacy +
+                [e for e in entities if not isinstance(e, Score)])
+            raise ndb.Return((game, result, True))
+
+        for attempt in range(TXN_RETRIES):
+            try:
+                outcome = yield ndb.transaction_async(txn, retries=0)
+                break
+            except datastore_errors.TransactionFailedError:
+                self._count('retries')
+                if attempt + 1 < TXN_RETRIES:
+                    yield ndb.sleep(BACKOFF * 2 ** attempt *
+                                    random.uniform(0.5, 1.5))
+        else:
+            raise ContentionError('Too many concurrent moves on this game, '
+                                  'try again!')
+        raise ndb.Return(outcome)
+
+    def _store_multi(self, games):
+        """Writes committed {urlsafe: Game} to memcache unless a newer
+        version is cached. Entries that lose a race are dropped."""
+        if not games:
+            return
+        client = self._client_factory()
+        cached = client.get_multi(games.keys(), namespace=NAMESPACE,
+                                  for_cas=True)
+        newer = dict((key, game) for key, game in games.items()
+                     if key in cached and
+                     (cached[key].version or 0) < game.version)
+        failed = list(client.cas_multi(newer, time=CACHE_SECONDS,
+                                       namespace=NAMESPACE) or [])
+        failed += client.add_multi(
+            dict((key, game) for key, game in games.items()
+                 if key not in cached), time=CACHE_SECONDS,
+            namespace=NAMESPACE) or []
+        if failed:
+            client.delete_multi(failed, namespace=NAMESPACE)
+            for key in failed:
+                self._forget(key)
+
+    def delete(self, urlsafe):
+        """Drops a game from the cache"""
+        self._forget(urlsafe)
+        self._client_factory().delete(urlsafe, namespace=NAMESPACE)
+
+
+game_cache = GameCache()
@@ -0,0 +1,94 @@
+"""counters.py - Sharded counters for running aggregates.
+
+Each named counter is split over NUM_SHARDS CounterShard entities so that
+frequent updates do not contend on one entity group. Increments run in a
+transaction on a random shard; reads sum all shards with one get_multi and
+are cached in memcache for a short while, with increments applied to the
+cached total as they happen. Increments that must only happen if another
+transaction commits are queued with it as tasks (see increment_tasks)."""
+
+import random
+
+from google.appengine.api import memcache, taskqueue
+from google.appengine.ext import ndb
+
+NUM_SHARDS = 20
+CACHE_SECONDS = 60
+INCREMENT_URL = '/tasks/increment_counter'
+
+## Counters of games in progress, see models.Game
+ACTIVE_GAMES = 'active_games'
+ATTEMPTS_REMAINING = 'attempts_remaining'
+
+
+class CounterShard(ndb.Model):
+    """One shard of a named counter, keyed '<name>-<shard>'"""
+    count = ndb.IntegerProperty(default=0, indexed=False)
+
+
+def _shard_keys(name):
+    return [ndb.Key(CounterShard, '{}-{}'.format(name, n))
+            for n in range(NUM_SHARDS)]
+
+
+def _cache_key(name):
+    return 'counter:' + name
+
+
+@ndb.tasklet
+def increment_async(name, delta=1):
+    """Adds delta (which may be negative) to the counter"""
+    key = random.choice(_shard_keys(name))
+
+    @ndb.tasklet
+    def txn():
+        shard = yield key.get_async()
+        shard = shard or CounterShard(key=key)
+        shard.count += delta
+        yield shard.put_async()
+    yield ndb.transaction_async(txn)
+    if delta > 0:
+        memcache.incr(_cache_key(name), delta)
+    elif delta < 0:
+        memcache.decr(_cache_key(name), -delta)
+
+
+def increment_tasks(deltas):
+    """Returns tasks that apply {name: delta} to the counters, one per
+    counter so that a retried task does not repeat the others. To be added
+    with utils.add_tasks."""
+    return [taskqueue.Task(url=INCREMENT_URL,
+                           params={'name': name, 'delta': delta})
+            for name, delta in sorted(deltas.items()) if delta]
+
+
+def get_counts(names):
+    """Returns {name: total} for the named counters"""
+    counts = memcache.get_multi(names, key_prefix='counter:')
+    missing = [name for name in names if name not in counts]
+    if missing:
+        shards = ndb.get_multi([key for name in missing
+                                for key in _shard_keys(name)])
+        for i, name in enumerate(missing):
+            counts[name] = sum(shard.count for shard in
+                               shards[i * NUM_SHARDS:(i + 1) * NUM_SHARDS]
+                               if shard)
+        memcache.add_multi(dict((name, counts[name]) for name in missing),
+                           time=CACHE_SECONDS, key_prefix='counter:')
+    return counts
+
+
+def get_count(name):
+    return get_counts([name])[name]
+
+
+def reconcile(name, actual):
+    """Corrects the counter to actual, e.g. after a full recount. Returns the
+    drift that was corrected."""
+    memcache.delete(_cache_key(name))
+    shards = ndb.get_multi(_shard_keys(name))
+    drift = actual - sum(shard.count for shard in shards if shard)
+    if drift:
+        increment_async(name, drift).get_result()
+    memcache.delete(_cache_key(name))
+    return drift
@@ -0,0 +1,112 @@
+"""dictionary.py - Preloaded word dictionary used to pick target words.
+
+The word list is read once per instance and kept in a compact, array-backed
+store: every word lives in a single string blob addressed by an offsets array,
+ordered by (length, word). Words of one length therefore form a contiguous
+range, so picking a random word within length bounds is a couple of bisects
+and a random index instead of a file read and list allocation per game."""
+
+import binascii
+import os
+import random
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+WORDLIST_PATH = os.path.join(os.path.dirname(__file__), 'wordlist.txt')
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+
+
+def to_bitset(indices, size):
+    """Packs a collection of indices below size into an integer bitset."""
+    bits = bytearray((size + 7) // 8)
+    for index in indices:
+        bits[index >> 3] |= 1 << (index & 7)
+    bits.reverse()
+    return int(binascii.hexlify(bits) or '0', 16)
+
+
+class WordDictionary(object):
+    """Immutable, length-indexed collection of words"""
+
+    def __init__(self, words):
+        words = sorted(set(w.strip().lower() for w in words
+                           if w.strip().isalpha()),
+                       key=lambda w: (len(w), w))
+        self._blob = ''.join(words)
+        self._offsets = array('L', [0])
+        # Parallel arrays: _lengths[i] words of that length start at
+        # _length_starts[i] (in sorted order).
+        self._lengths = array('H')
+        self._length_starts = array('L')
+        for index, word in enumerate(words):
+            self._offsets.append(self._offsets[-1] + len(word))
+            if not self._lengths or self._lengths[-1] != len(word):
+                self._lengths.append(len(word))
+                self._length_starts.append(index)
+
+    @classmethod
+    def from_file(cls, path=WORDLIST_PATH):
+        """Loads a dictionary from a newline separated word file"""
+        with open(path) as f:
+            return cls(f)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        return self._blob[self._offsets[index]:self._offsets[index + 1]]
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def lengths(self):
+        """Returns the distinct word lengths, shortest first"""
+        return list(self._lengths)
+
+    def length_range(self, min_length=None, max_length=None):
+        """Returns the (start, end) index range of words whose length lies
+        within the inclusive bounds."""
+        lo = 0
+        hi = len(self._lengths)
+        if min_length is not None:
+            lo = bisect_left(self._lengths, min_length)
+        if max_length is not None:
+            hi = bisect_right(self._lengths, max_length)
+        if lo >= hi:
+            return 0, 0
+        start = self._length_starts[lo]
+        if hi < len(self._lengths):
+            end = self._length_starts[hi]
+        else:
+            end = len(self)
+        return start, end
+
+    def random_word(self, min_length=None, max_length=None):
+        """Returns a random word within the inclusive length bounds.
+        Raises:
+            ValueError: if the bounds are inverted or no word matches them."""
+        if (min_length is not None and max_length is not None and
+                max_length < min_length):
+            raise ValueError('Maximum must be greater than minimum!')
+        start, end = self.length_range(min_length, max_length)
+        if start == end:
+            raise ValueError('No words between {} and {} letters long!'
+                             .format(min_length, max_length))
+        return self[random.randrange(start, end)]
+
+
+_dictionary = None
+_lock = threading.Lock()
+
+
+def get_dictionary():
+    """Returns the instance-wide WordDictionary, loading it on first use"""
+    global _dictionary
+    if _dictionary is None:
+        with _lock:
+            if _dictionary is None:
+                _dictionary = WordDictionary.from_file()
+    return _dictionary
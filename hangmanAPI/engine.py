@@ -0,0 +1,124 @@
+"""engine.py - Pure-Python hangman rules, independent of App Engine.
+
+Guessed letters are kept as a 26-bit mask and the target word as a
+letter -> positions map, so a letter guess updates the revealed board in
+O(positions hit) instead of re-deriving the whole board from the guess
+history on every move."""
+
+from collections import namedtuple
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz'
+HIDDEN = '_'
+
+
+def letter_bit(letter):
+    """Returns the mask bit for a single lowercase letter"""
+    return 1 << (ord(letter) - 97)
+
+
+def letters_to_mask(letters):
+    """Returns the mask for an iterable of letters. Games stored before the
+    mask kept guesses verbatim, so letters are lower-cased and anything
+    outside a-z is skipped."""
+    mask = 0
+    for letter in (letters or '').lower():
+        if letter in ALPHABET:
+            mask |= letter_bit(letter)
+    return mask
+
+
+def mask_to_letters(mask):
+    """Returns the letters set in mask, in alphabetical order"""
+    return ''.join(letter for i, letter in enumerate(ALPHABET)
+                   if mask & (1 << i))
+
+
+class Board(object):
+    """The revealed state of a target word for a set of guessed letters"""
+    __slots__ = ('target_word', 'guessed_mask', 'hidden', '_positions',
+                 '_revealed')
+
+    def __init__(self, target_word, guessed_mask=0):
+        self.target_word = target_word
+        self.guessed_mask = guessed_mask
+        self._positions = {}
+        for i, letter in enumerate(target_word):
+            self._positions.setdefault(letter, []).append(i)
+        self._revealed = [HIDDEN] * len(target_word)
+        self.hidden = len(target_word)
+        for letter, positions in self._positions.items():
+            if guessed_mask & letter_bit(letter):
+                self._reveal(letter, positions)
+
+    def _reveal(self, letter, positions):
+        for i in positions:
+            self._revealed[i] = letter
+        self.hidden -= len(positions)
+
+    def is_guessed(self, letter):
+        return bool(self.guessed_mask & letter_bit(letter))
+
+    def guess(self, letter):
+        """Marks letter as guessed and returns the number of positions it
+        revealed."""
+        self.guessed_mask |= letter_bit(letter)
+        positions = self._positions.get(letter, ())
+        self._reveal(letter, positions)
+        return len(positions)
+
+    @property
+    def solved(self):
+        return self.hidden == 0
+
+    @property
+    def pattern(self):
+        """The board as a string, e.g. 'c_e__y'"""
+        return ''.join(self._revealed)
+
+    def display(self):
+        """Returns the board as shown to players, e.g. 'c _ e _ _ y'"""
+        return ' '.join(self._revealed)
+
+
+# changed is False for moves that must not be persisted, e.g. repeated
+# letters.
+MoveResult = namedtuple('MoveResult', ['guess', 'message',
+                                       'attempts_remaining', 'game_over',
+                                       'won', 'changed'])
+
+
+def play_move(board, attempts_remaining, guess_letter=None, guess_word=None):
+    """Applies one guess to board and returns a MoveResult. A word guess takes
+    precedence over a letter guess. Wrong word guesses and letters not in the
+    target word cost one attempt; the game is lost when none remain.
+    Raises:
+        ValueError: if neither a word nor a single letter was guessed."""
+    if guess_word:
+        guess = guess_word.strip().lower()
+        if guess == board.target_word:
+            return MoveResult(guess, 'You win!', attempts_remaining,
+                              True, True, True)
+        attempts_remaining -= 1
+        message = 'Incorrect Guess!'
+    elif guess_letter:
+        guess = guess_letter.strip().lower()
+        if len(guess) != 1 or guess not in ALPHABET:
+            raise ValueError('Guess must be a single letter!')
+        if board.is_guessed(guess):
+            return MoveResult(guess, 'Letter already guessed!',
+                              attempts_remaining, False, False, False)
+        if not board.guess(guess):
+            attempts_remaining -= 1
+        message = board.display()
+    else:
+        raise ValueError('Guess a letter or a word!')
+
+    if attempts_remaining < 1:
+        return MoveResult(guess, message + '  Game over!', attempts_remaining,
+                          True, False, True)
+    return MoveResult(guess, message, attempts_remaining, False, False, True)
+
+
+def score_guesses(attempts_allowed, attempts_remaining):
+    """The score of a finished game: the number of attempts used"""
+    return attempts_allowed - attempts_remaining
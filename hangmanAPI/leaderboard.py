@@ -0,0 +1,144 @@
+"""leaderboard.py - Materialized user rankings.
+
+A periodic task ranks every user by win ratio, using the average number of
+guesses per game as tiebreaker, and writes the result as fixed-size
+LeaderboardPage entities plus one LeaderboardRank per user whose rank
+changed. The LeaderboardSnapshot entity points at the current set of pages.
+Pages and the snapshot pointer are also kept in memcache, so serving a page
+of the leaderboard is one or two cache reads."""
+
+import logging
+import time
+
+from google.appengine.api import memcache, taskqueue
+from google.appengine.ext import ndb
+
+from models import User, UserStats, LeaderboardSnapshot, LeaderboardPage, \
+    LeaderboardRank
+
+PAGE_SIZE = 100
+BATCH_SIZE = 500
+MEMCACHE_SNAPSHOT = 'leaderboard:current'
+MEMCACHE_REFRESH = 'leaderboard:refresh'
+REFRESH_URL = '/tasks/refresh_leaderboard'
+# Long enough for the queued rebuild to publish the first snapshot
+REFRESH_SECONDS = 10 * 60
+
+
+def _page_cache_key(snapshot, number):
+    return 'leaderboard:{}:{}'.format(snapshot, number)
+
+
+def materialize():
+    """Ranks all users and publishes a new leaderboard snapshot"""
+    entries = []
+    cursor, more = None, True
+    while more:
+        users, cursor, more = User.query().fetch_page(BATCH_SIZE,
+                                                      start_cursor=cursor)
+        stats = UserStats.totals(users)
+        for user in users:
+            entries.append((user.key.id(), user.name,
+                            stats[user.key].win_ratio,
+                            stats[user.key].average_guesses))
+        more = more and cursor is not None
+    entries.sort(key=lambda e: (-e[2], e[3], e[1]))
+
+    snapshot = int(time.time() * 1000)
+    pages = []
+    for number, start in enumerate(range(0, len(entries), PAGE_SIZE)):
+        pages.append(LeaderboardPage(
+            id=LeaderboardPage.page_id(snapshot, number),
+            entries=[[name, ratio, guesses] for _, name, ratio, guesses
+                     in entries[start:start + PAGE_SIZE]]))
+    for start in range(0, len(pages), BATCH_SIZE):
+        ndb.put_multi(pages[start:start + BATCH_SIZE])
+    _write_ranks(entries)
+
+    previous = LeaderboardSnapshot.get_by_id(LeaderboardSnapshot.CURRENT)
+    current = LeaderboardSnapshot(id=LeaderboardSnapshot.CURRENT,
+                                  snapshot=snapshot, total=len(entries),
+                                  page_size=PAGE_SIZE)
+    current.put()
+    memcache.set_multi(dict(
+        (_page_cache_key(snapshot, number), page.entries)
+        for number, page in enumerate(pages)))
+    memcache.set(MEMCACHE_SNAPSHOT, current)
+    if previous:
+        ndb.delete_multi(previous.page_keys())
+    logging.info('Leaderboard snapshot %d: %d users in %d pages',
+                 snapshot, len(entries), len(pages))
+    return current
+
+
+def _write_ranks(entries):
+    """Saves the rank of each user whose rank changed"""
+    for start in range(0, len(entries), BATCH_SIZE):
+        batch = entries[start:start + BATCH_SIZE]
+        keys = [ndb.Key(LeaderboardRank, user_id) for user_id, _, _, _ in batch]
+        changed = []
+        for rank, key, old in zip(range(start + 1, start + len(batch) + 1),
+                                  keys, ndb.get_multi(keys)):
+            if old is None or old.rank != rank:
+                changed.append(LeaderboardRank(key=key, rank=rank))
+        ndb.put_multi(changed)
+
+
+def current_snapshot():
+    """Returns the current LeaderboardSnapshot, or None before the first
+    materialize has run."""
+    snapshot = memcache.get(MEMCACHE_SNAPSHOT)
+    if snapshot is None:
+        snapshot = LeaderboardSnapshot.get_by_id(LeaderboardSnapshot.CURRENT)
+        if snapshot is not None:
+            memcache.add(MEMCACHE_SNAPSHOT, snapshot)
+    return snapshot
+
+
+def request_refresh():
+    """Queues a rebuild of the leaderboard unless one was queued in the
+    last REFRESH_SECONDS, so that requests made before the first snapshot
+    do not each add a task."""
+    if not memcache.add(MEMCACHE_REFRESH, True, time=REFRESH_SECONDS):
+        return
+    try:
+        taskqueue.add(url=REFRESH_URL)
+    except Exception:
+        memcache.delete(MEMCACHE_REFRESH)
+        raise
+
+
+def get_page(snapshot, offset, limit):
+    """Returns up to limit [name, ratio, average guesses] entries starting at
+    the 0-based rank offset."""
+    first = offset // snapshot.page_size
+    last = min(offset + limit - 1, snapshot.total - 1) // snapshot.page_size
+    numbers = range(first, last + 1)
+    cache_keys = [_page_cache_key(snapshot.snapshot, n) for n in numbers]
+    cached = memcache.get_multi(cache_keys)
+    missing = [n for n, k in zip(numbers, cache_keys) if k not in cached]
+    if missing:
+        pages = ndb.get_multi([ndb.Key(LeaderboardPage,
+                                       LeaderboardPage.page_id(
+                                           snapshot.snapshot, n))
+                               for n in missing])
+        loaded = dict((_page_cache_key(snapshot.snapshot, n), page.entries)
+                      for n, page in zip(missing, pages) if page)
+        memcache.set_multi(loaded)
+        cached.update(loaded)
+    entries = []
+    for key in cache_keys:
+        entries.extend(cached.get(key, []))
+    start = offset - first * snapshot.page_size
+    return entries[start:start + limit]
+
+
+def get_rank(user):
+    """Returns the user's 1-based rank in the latest snapshot, or None"""
+    return get_rank_async(user).get_result()
+
+
+@ndb.tasklet
+def get_rank_async(user):
+    rank = yield LeaderboardRank.get_by_id_async(user.key.id())
+    raise ndb.Return(rank.rank if rank else None)
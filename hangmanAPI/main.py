@@ -2,46 +2,378 @@
 
 """main.py - This file contains handlers that are called by taskqueue and/or
 cronjobs."""
+import json
 import logging
+from datetime import date
 
+import endpoints
 import webapp2
-from google.appengine.api import mail, app_identity
-#from api import GuessANumberApi
-from api import HangmanAPI
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
 
-from models import User
+from models import User, UserName, UserStats, Game, Score, HighScoreBoard
+from dictionary import get_dictionary
+from solver import get_solver
+import archive
+import counters
+import leaderboard
+import profiling
+import reminders
+import scores
+from utils import get_user_names
 
+BACKFILL_BATCH_SIZE = 50
+RECONCILE_BATCH_SIZE = 500
+MIGRATE_BATCH_SIZE = 100
+HIGH_SCORES_BATCH_SIZE = 500
+## kinds rewritten by MigrateEntities, in order. Users come first, as their
+## batches also create the UserName entries that legacy users are found by.
+MIGRATE_MODELS = (User, Game, Score)
 
-class SendReminderEmail(webapp2.RequestHandler):
+
+class InstrumentedHandler(webapp2.RequestHandler):
+    """Records each request as '<Handler>.<method>', see profiling.py"""
+    def dispatch(self):
+        name = '{}.{}'.format(type(self).__name__,
+                              self.request.method.lower())
+        with profiling.record(name):
+            return super(InstrumentedHandler, self).dispatch()
+
+
+class Warmup(InstrumentedHandler):
+    def get(self):
+        """Load what the first requests of a new instance would otherwise
+        pay for: the endpoints modules, the word dictionary, the solver
+        index and the cached leaderboard and high score reads. Called by App
+        Engine before the instance receives traffic."""
+        import api  # the endpoints app runs in the same instance
+        get_dictionary()
+        get_solver()
+        leaderboard.current_snapshot()
+        HighScoreBoard.get_entries('all')
+        self.response.set_status(204)
+
+
+class SendReminderEmail(InstrumentedHandler):
     def get(self):
         """Send a reminder email to each User with an email about games.
-        Called every hour using a cron job"""
-        app_id = app_identity.get_application_id()
-        users = User.query(User.email != None)
+        Called every 12 hours using a cron job; the work is done by a chain
+        of tasks, see reminders.py"""
+        run = reminders.start()
+        logging.info('Started reminder run %s', run)
+
+
+class CollectReminders(InstrumentedHandler):
+    def post(self):
+        """Fan out one page of users with unfinished games."""
+        reminders.collect(self.request.get('run'),
+                          int(self.request.get('page')),
+                          self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class SendReminders(InstrumentedHandler):
+    def get(self):
+        """Report the emails sent and batches done so far by the reminder run
+        given as run, as logged when the run started."""
+        run = self.request.get('run')
+        if not run:
+            self.abort(400, 'run is required')
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(dict(reminders.metrics(run), run=run)))
+
+    def post(self):
+        """Email one batch of users with unfinished games."""
+        reminders.send(self.request.get('run'),
+                       int(self.request.get('page')),
+                       self.request.get('users').split(','))
+        self.response.set_status(204)
+
+
+class ReconcileActiveGames(InstrumentedHandler):
+    def get(self):
+        """Start recounting active games. Called hourly by a cron job."""
+        taskqueue.add(url='/tasks/reconcile_active_games')
+
+    def post(self):
+        """Count one batch of active games, then queue the next batch. The
+        last batch corrects any drift of the active games counters."""
+        cursor = self.request.get('cursor')
+        count = int(self.request.get('count', 0))
+        total = int(self.request.get('total', 0))
+        keys, next_cursor, more = Game.query(
+            Game.game_over == False).fetch_page(
+                RECONCILE_BATCH_SIZE, keys_only=True,
+                start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        for game in ndb.get_multi(keys):
+            if game and not game.game_over:
+                count += 1
+                total += game.attempts_remaining
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/reconcile_active_games',
+                          params={'cursor': next_cursor.urlsafe(),
+                                  'count': count, 'total': total})
+        else:
+            logging.info('Active games drift corrected: %d games, %d attempts',
+                         counters.reconcile(counters.ACTIVE_GAMES, count),
+                         counters.reconcile(counters.ATTEMPTS_REMAINING,
+                                            total))
+        self.response.set_status(204)
+
+
+class RefreshLeaderboard(InstrumentedHandler):
+    def get(self):
+        """Rebuild the leaderboard. Called periodically by a cron job."""
+        leaderboard.materialize()
+        self.response.set_status(204)
+
+    def post(self):
+        """Rebuild the leaderboard when asked by a taskqueue task."""
+        leaderboard.materialize()
+        self.response.set_status(204)
+
+
+class BackfillUserStats(InstrumentedHandler):
+    def get(self):
+        """Start rebuilding every User's UserStats from their Scores."""
+        taskqueue.add(url='/tasks/backfill_user_stats')
+        self.response.write('User stats backfill started.')
+
+    def post(self):
+        """Rebuild the UserStats of one batch of Users, then queue the next
+        batch. Live games that end during the run may need a second run."""
+        cursor = self.request.get('cursor')
+        users, next_cursor, more = User.query().fetch_page(
+            BACKFILL_BATCH_SIZE,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        stats = []
         for user in users:
-            ## adjust hourly email reminder only if user has unfinished
-            ## games
-            games = Game.query(Game.user == user.key)
-            games = games.filter(Game.game_over == False)
-            if games.count()>0:
-                subject = 'This is a reminder!'
-                body = 'Hello {}, you have incomplete Hangman games!'.format(user.name)
-                # This will send test emails, the arguments to send_mail are:
-                # from, to, subject, body
-                mail.send_mail('noreply@{}.appspotmail.com'.format(app_id),
-                               user.email,
-                               subject,
-                               body)
+            stats.extend(UserStats.rebuild(user))
+        ndb.put_multi(stats)
+        logging.info('Rebuilt stats for %d users', len(users))
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/backfill_user_stats',
+                          params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class CleanupGames(InstrumentedHandler):
+    def get(self):
+        """Start archiving finished games and expiring abandoned ones.
+        Called daily by a cron job, see archive.py"""
+        archive.start()
+        self.response.set_status(204)
+
+
+class ArchiveGames(InstrumentedHandler):
+    def post(self):
+        """Archive one page of finished games."""
+        archive.archive(self.request.get('cutoff'),
+                        self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class ExpireGames(InstrumentedHandler):
+    def post(self):
+        """Delete one page of abandoned games."""
+        archive.expire(self.request.get('cutoff'),
+                       self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class IncrementCounter(InstrumentedHandler):
+    def post(self):
+        """Apply one counter change queued with a move, see
+        counters.increment_tasks"""
+        counters.increment_async(self.request.get('name'),
+                                 int(self.request.get('delta'))).get_result()
+        self.response.set_status(204)
+
+
+class RecordScore(InstrumentedHandler):
+    def post(self):
+        """Record the Score of a game finished by a move, see
+        Score.record_task. Recording it again has no effect."""
+        get = self.request.get
+        Score(key=ndb.Key(urlsafe=get('key')),
+              user=ndb.Key(urlsafe=get('user')),
+              date=date.fromordinal(int(get('date'))),
+              won=get('won') == '1', guesses=int(get('guesses'))).record()
+        self.response.set_status(204)
+
 
+class BumpScoresVersion(InstrumentedHandler):
+    def post(self):
+        """Bump the scores version once the score queries include a newly
+        recorded Score, see Score.bump_version_task"""
+        Score.bump_version()
+        self.response.set_status(204)
+
+
+class AddHighScore(InstrumentedHandler):
+    def post(self):
+        """Add one winning Score to the high score boards. Queued when the
+        Score is recorded, see HighScoreBoard.add"""
+        HighScoreBoard.add(json.loads(self.request.get('entry')))
+        self.response.set_status(204)
+
+
+class RebuildHighScores(InstrumentedHandler):
+    def get(self):
+        """Clear the high score boards and rebuild them from all winning
+        Scores, e.g. after a cold start."""
+        ndb.delete_multi(HighScoreBoard.query().fetch(keys_only=True))
+        taskqueue.add(url='/tasks/rebuild_high_scores')
+        self.response.write('High score rebuild started.')
+
+    def post(self):
+        """Add one batch of winning Scores, best first, to the boards of
+        their windows, then queue the next batch."""
+        cursor = self.request.get('cursor')
+        batch, next_cursor, more = Score.query(Score.won == True).order(
+            Score.guesses).fetch_page(
+                HIGH_SCORES_BATCH_SIZE,
+                start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        names = get_user_names(score.user for score in batch)
+        boards = {}
+        for score in batch:
+            entry = HighScoreBoard.entry(score, names.get(score.user, ''))
+            for board_id in HighScoreBoard.window_ids(score.date):
+                boards.setdefault(board_id, []).append(entry)
+        # a failed board fails the task, which is then retried with the same
+        # cursor; adding entries twice leaves a board unchanged
+        for future in [HighScoreBoard.insert_async(board_id, entries)
+                       for board_id, entries in boards.items()]:
+            future.get_result()
+        Score.bump_version()
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/rebuild_high_scores',
+                          params={'cursor': next_cursor.urlsafe()})
+        self.response.set_status(204)
+
+
+class CompactScores(InstrumentedHandler):
+    def get(self, listing, user_name=None):
+        """Serve get_scores, get_user_scores or get_high_scores as columnar
+        JSON, or as protobuf with format=proto. Answers 304 when the
+        If-None-Match ETag is still current, see scores.py"""
+        tag = scores.etag(self.request.path, self.request.query_string)
+        if tag and tag in [t.strip() for t in self.request.headers.get(
+                'If-None-Match', '').split(',')]:
+            self.response.set_status(304)
+            return
+        try:
+            limit = int(self.request.get('limit') or 0)
+            cursor = self.request.get('cursor') or None
+            if listing == 'high_scores':
+                page = scores.high_scores(limit, self.request.get('window'))
+            elif listing == 'user':
+                user_key = User.key_for_name(user_name)
+                if not user_key:
+                    self.abort(404, 'A User with that name does not exist!')
+                page = scores.user_scores(user_key, limit, cursor)
+            else:
+                page = scores.all_scores(limit, cursor)
+        except (ValueError, endpoints.BadRequestException) as e:
+            self.abort(400, str(e))
+        if self.request.get('format') == 'proto':
+            from protorpc import protobuf
+            self.response.content_type = 'application/x-protobuf'
+            self.response.write(protobuf.encode_message(page.to_forms()))
+        else:
+            self.response.content_type = 'application/json'
+            self.response.write(json.dumps(page.to_columns(),
+                                           separators=(',', ':')))
+        if tag:
+            self.response.headers['ETag'] = tag
+            self.response.headers['Cache-Control'] = 'no-cache'
+
+
+@ndb.transactional_tasklet
+def _rewrite(key):
+    """Puts an entity back as the current model stores it, with the Moves
+    converted from the log of a legacy Game. Runs in a transaction so a
+    concurrent write to the entity is not overwritten."""
+    entity = yield key.get_async()
+    if entity:
+        moves = entity.upgrade() if isinstance(entity, Game) else []
+        yield ndb.put_multi_async([entity] + moves)
+
+
+class MigrateEntities(InstrumentedHandler):
+    def get(self):
+        """Start rewriting every User, Game and Score with the current
+        models, dropping obsolete properties and unindexed properties' index
+        rows. Run it right after deploying: until the Users are done, users
+        created before the UserName index cannot be found by name."""
+        taskqueue.add(url='/tasks/migrate_entities')
+        self.response.write('Entity migration started.')
 
-class UpdateAverageMovesRemaining(webapp2.RequestHandler):
     def post(self):
-        """Update game listing announcement in memcache."""
-        HangmanApi._cache_average_attempts()
+        """Rewrite one batch of entities of one kind, then queue the next
+        batch, or the first batch of the next kind."""
+        kinds = [model._get_kind() for model in MIGRATE_MODELS]
+        kind = self.request.get('kind') or kinds[0]
+        model = MIGRATE_MODELS[kinds.index(kind)]
+        cursor = self.request.get('cursor')
+        keys, next_cursor, more = model.query().fetch_page(
+            MIGRATE_BATCH_SIZE, keys_only=True,
+            start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+        if model is User:
+            # User.name is not indexed, so users created before the UserName
+            # index can only be found by name once it has their entry
+            users = [user for user in ndb.get_multi(keys) if user]
+            names = ndb.get_multi([ndb.Key(UserName, user.name)
+                                   for user in users])
+            ndb.put_multi([UserName(id=user.name, user=user.key)
+                           for user, name in zip(users, names) if not name])
+        failed = []
+        for key, future in zip(keys, [_rewrite(key) for key in keys]):
+            try:
+                future.get_result()
+            except Exception:
+                logging.exception('Could not migrate %s', key)
+                failed.append(key)
+        if failed:
+            # the task is retried with the same cursor; rewriting the
+            # entities that did migrate again is harmless
+            self.abort(500, 'Migrated {} of {} {} entities'.format(
+                len(keys) - len(failed), len(keys), kind))
+        logging.info('Migrated %d %s entities', len(keys), kind)
+        if more and next_cursor:
+            taskqueue.add(url='/tasks/migrate_entities',
+                          params={'kind': kind,
+                                  'cursor': next_cursor.urlsafe()})
+        elif kind != kinds[-1]:
+            taskqueue.add(url='/tasks/migrate_entities',
+                          params={'kind': kinds[kinds.index(kind) + 1]})
         self.response.set_status(204)
 
 
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', Warmup),
     ('/crons/send_reminder', SendReminderEmail),
-    ('/tasks/cache_average_attempts', UpdateAverageMovesRemaining),
+    ('/tasks/collect_reminders', CollectReminders),
+    ('/tasks/send_reminders', SendReminders),
+    ('/crons/reconcile_active_games', ReconcileActiveGames),
+    ('/tasks/reconcile_active_games', ReconcileActiveGames),
+    ('/tasks/backfill_user_stats', BackfillUserStats),
+    ('/tasks/migrate_entities', MigrateEntities),
+    ('/crons/cleanup_games', CleanupGames),
+    ('/tasks/archive_games', ArchiveGames),
+    ('/tasks/expire_games', ExpireGames),
+    ('/tasks/increment_counter', IncrementCounter),
+    ('/tasks/record_score', RecordScore),
+    ('/tasks/bump_scores_version', BumpScoresVersion),
+    ('/tasks/add_high_score', AddHighScore),
+    ('/tasks/rebuild_high_scores', RebuildHighScores),
+    webapp2.Route('/compact/scores', CompactScores,
+                  defaults={'listing': 'all'}),
+    webapp2.Route('/compact/scores/user/<user_name>', CompactScores,
+                  defaults={'listing': 'user'}),
+    webapp2.Route('/compact/high_scores', CompactScores,
+                  defaults={'listing': 'high_scores'}),
+    ('/crons/refresh_leaderboard', RefreshLeaderboard),
+    ('/tasks/refresh_leaderboard', RefreshLeaderboard),
 ], debug=True)
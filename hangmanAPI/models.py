@@ -2,86 +2,376 @@
 entities used by the Game. Because these classes are also regular Python
 classes they can include methods (such as 'to_form' and 'new_game')."""
 
+import ast
+import bisect
+import json
 import random
+import re
 from datetime import date
 from protorpc import messages
+from google.appengine.api import memcache, taskqueue
 from google.appengine.ext import ndb
 
+from dictionary import get_dictionary
+from engine import Board, letters_to_mask, play_move, score_guesses
+from utils import LRUCache, add_tasks
+import counters
+
+# In-process cache of User keys by name, in front of memcache.
+_user_keys = LRUCache(1000)
+
+
+def _user_key_cache_key(name):
+    return 'user_key:' + name
+
+
+def _drop_properties(entity, names):
+    """Removes properties the model no longer declares from an entity loaded
+    from an older version, so that putting it does not write them back"""
+    for name in names:
+        if name in entity._properties:
+            entity._clone_properties()
+            del entity._properties[name]
+            entity._values.pop(name, None)
+
 
 class User(ndb.Model):
-    """User profile"""
-    name = ndb.StringProperty(required=True)
-    email = ndb.StringProperty()
-    performance = ndb.ComputedProperty(lambda self: self._get_user_ranking())
-    ## added in guess ratio to break tiebreak in ranking
-    guess_performance = ndb.ComputedProperty(lambda self: self._get_user_guesses())
-
-    def _get_user_ranking(self):
-        # calculate win/loss ratio per player
-        scores = Score.query(Score.user == self.key).fetch()
-        tot_games = 0
-        tot_wins = 0
-        if scores:
-            tot_games = len(scores)
-            tot_wins = sum([1 if score.won == True else 0 for score in scores])
-        if tot_games == 0:
-            ratio = 0
-        else:
-            ratio = 100*(tot_wins/float(tot_games))
-        return float(ratio)
-
-    def _get_user_guesses(self):
-        scores = Score.query(Score.user == self.key).fetch()
-        tot_guesses = 0
-        tot_games = 0
-        if scores:
-            tot_games = len(scores)
-            tot_guesses = sum([score.guesses for score in scores])
-        if tot_games == 0:
-            ratio = 0
+    """User profile. Users are found by name through UserName, so no
+    property is indexed."""
+    name = ndb.StringProperty(required=True, indexed=False)
+    email = ndb.StringProperty(indexed=False)
+    ## number of UserStats shards; raise it for users finishing many games
+    ## concurrently
+    stats_shards = ndb.IntegerProperty(default=1, indexed=False)
+
+    @classmethod
+    def create(cls, name, email=None):
+        """Creates and returns a User, claiming its name in the UserName index
+        in the same transaction. Raises ValueError if the name is taken."""
+        if cls.key_for_name(name):
+            raise ValueError('A User with that name already exists!')
+        key = ndb.Key(cls, cls.allocate_ids(1)[0])
+
+        @ndb.transactional(xg=True)
+        def txn():
+            if UserName.get_by_id(name):
+                raise ValueError('A User with that name already exists!')
+            user = cls(key=key, name=name, email=email)
+            ndb.put_multi([user, UserName(id=name, user=key)])
+            return user
+        return txn()
+
+    @classmethod
+    def key_for_name(cls, name):
+        """Returns the key of the User called name, or None. Resolved from
+        the in-process cache, memcache, then the UserName index."""
+        if not name:
+            return None
+        key = _user_keys.get(name)
+        if key:
+            return key
+        urlsafe = memcache.get(_user_key_cache_key(name))
+        if urlsafe:
+            key = ndb.Key(urlsafe=urlsafe)
         else:
-            ratio = 100*(tot_guesses/float(tot_games))
-        return float(ratio)       
+            # Users created before the UserName index get their entry from
+            # /tasks/migrate_entities, see main.MigrateEntities
+            index = UserName.get_by_id(name)
+            if not index:
+                return None
+            key = index.user
+            memcache.set(_user_key_cache_key(name), key.urlsafe())
+        _user_keys.set(name, key)
+        return key
+
+    @classmethod
+    def get_by_name(cls, name):
+        """Returns the User called name, or None"""
+        key = cls.key_for_name(name)
+        user = key.get() if key else None
+        if key and not user:
+            cls._forget_name(name)
+        return user
+
+    @staticmethod
+    def _forget_name(name):
+        _user_keys.delete(name)
+        memcache.delete(_user_key_cache_key(name))
+
+    ## computed properties of old User entities, no longer stored
+    OBSOLETE_PROPERTIES = ('performance', 'guess_performance')
+
+    def _pre_put_hook(self):
+        _drop_properties(self, self.OBSOLETE_PROPERTIES)
+
+    def _post_put_hook(self, future):
+        self._forget_name(self.name)
+
+    @classmethod
+    def _pre_delete_hook(cls, key):
+        user = key.get()
+        if user:
+            cls._forget_name(user.name)
+            ndb.Key(UserName, user.name).delete()
+
+    def stats_keys(self):
+        return UserStats.shard_keys(self.key, self.stats_shards or 1)
+
+    def to_form(self, stats=None):
+        """Returns a UserRankForm, reading the user's stats unless given"""
+        if stats is None:
+            stats = UserStats.totals([self])[self.key]
+        return UserRankForm(user=self.name, ratio=stats.win_ratio,
+                            average_guesses=stats.average_guesses)
+
+
+class UserName(ndb.Model):
+    """Unique index of User names: keyed by the name, points to the User"""
+    user = ndb.KeyProperty(required=True, kind='User', indexed=False)
+
+
+class UserStats(ndb.Model):
+    """Aggregate results of a user's finished games, updated as each game's
+    Score is recorded. A user's stats may be split over several shards to
+    spread writes; shard 0 is keyed by the user's id, shard n by 'id-n'."""
+    games = ndb.IntegerProperty(default=0, indexed=False)
+    wins = ndb.IntegerProperty(default=0, indexed=False)
+    guesses = ndb.IntegerProperty(default=0, indexed=False)
+
+    @classmethod
+    def shard_keys(cls, user_key, shards=1):
+        user_id = str(user_key.id())
+        return [ndb.Key(cls, user_id)] + [
+            ndb.Key(cls, '{}-{}'.format(user_id, n)) for n in range(1, shards)]
+
+    @classmethod
+    def totals(cls, users):
+        """Returns {user key: unsaved UserStats summed over its shards} for
+        User entities, using a single get_multi."""
+        return cls.totals_async(users).get_result()
+
+    @classmethod
+    @ndb.tasklet
+    def totals_async(cls, users):
+        keys = [user.stats_keys() for user in users]
+        shards = yield ndb.get_multi_async([key for ks in keys for key in ks])
+        shards = iter(shards)
+        totals = {}
+        for user, user_keys in zip(users, keys):
+            total = cls()
+            for shard in [next(shards) for _ in user_keys]:
+                if shard:
+                    total.games += shard.games
+                    total.wins += shard.wins
+                    total.guesses += shard.guesses
+            totals[user.key] = total
+        raise ndb.Return(totals)
+
+    @property
+    def win_ratio(self):
+        """Percentage of games won"""
+        return 100 * (self.wins / float(self.games)) if self.games else 0.0
+
+    @property
+    def average_guesses(self):
+        return self.guesses / float(self.games) if self.games else 0.0
+
+    @classmethod
+    def rebuild(cls, user):
+        """Recomputes a user's stats from all of its Scores. Returns the
+        entities to save: the totals in shard 0 and every other shard
+        zeroed."""
+        stats = cls(key=ndb.Key(cls, str(user.key.id())))
+        for score in Score.query(Score.user == user.key):
+            stats.games += 1
+            stats.wins += 1 if score.won else 0
+            stats.guesses += score.guesses
+        return [stats] + [cls(key=key) for key in user.stats_keys()[1:]]
+
+
+class LeaderboardSnapshot(ndb.Model):
+    """Points at the current set of LeaderboardPages, see leaderboard.py"""
+    CURRENT = 'current'
+    snapshot = ndb.IntegerProperty(required=True, indexed=False)
+    total = ndb.IntegerProperty(required=True, indexed=False)
+    page_size = ndb.IntegerProperty(required=True, indexed=False)
+    created = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+    def page_keys(self):
+        pages = (self.total + self.page_size - 1) // self.page_size
+        return [ndb.Key(LeaderboardPage,
+                        LeaderboardPage.page_id(self.snapshot, n))
+                for n in range(pages)]
+
+
+class LeaderboardPage(ndb.Model):
+    """One page of ranked [user name, win ratio, average guesses] entries"""
+    entries = ndb.JsonProperty(compressed=True)
+
+    @staticmethod
+    def page_id(snapshot, number):
+        return '{}:{}'.format(snapshot, number)
+
+
+class LeaderboardRank(ndb.Model):
+    """A user's rank in the latest leaderboard, keyed by the user's id"""
+    rank = ndb.IntegerProperty(required=True, indexed=False)
 
-    def to_form(self):
-        return UserRankForm(user=self.name, ratio=self.performance)
 
 class Game(ndb.Model):
-    """Game object"""
-    target_word = ndb.StringProperty(required=True)
-    guess_word = ndb.StringProperty()
-    # add in a guess attempt, must be one-letter in length
-    guess_letter = ndb.StringProperty()
-    guessed_letters = ndb.StringProperty()
-    attempts_allowed = ndb.IntegerProperty(required=True)
-    attempts_remaining = ndb.IntegerProperty(required=True, default=12)
-    ## add in game history tracker
-    history = ndb.StringProperty()
+    """Game object. Only user and game_over are queried, so every other
+    property is unindexed and a move does not rewrite any index row."""
+    target_word = ndb.StringProperty(required=True, indexed=False)
+    ## guessed letters of games stored before guessed_mask; cleared on put
+    guessed_letters = ndb.StringProperty(indexed=False)
+    # 26-bit set of guessed letters, see engine.py
+    guessed_mask = ndb.IntegerProperty(indexed=False)
+    attempts_allowed = ndb.IntegerProperty(required=True, indexed=False)
+    attempts_remaining = ndb.IntegerProperty(required=True, default=12,
+                                             indexed=False)
+    ## number of moves recorded in the game's Move log
+    move_count = ndb.IntegerProperty(default=0, indexed=False)
     game_over = ndb.BooleanProperty(required=True, default=False)
     user = ndb.KeyProperty(required=True, kind='User')
+    ## time of the last write, used to archive or expire the game (see
+    ## archive.py)
+    last_move = ndb.DateTimeProperty(auto_now=True)
+    ## bumped by every committed move, see cache.py
+    version = ndb.IntegerProperty(default=0, indexed=False)
+
+    ## properties of old Game entities, no longer stored. Their move log,
+    ## history, is kept until upgrade turns it into Moves
+    OBSOLETE_PROPERTIES = ('guess_word', 'guess_letter')
+
+    def _pre_put_hook(self):
+        if self.guessed_letters is not None:
+            if self.guessed_mask is None:
+                self.guessed_mask = letters_to_mask(self.guessed_letters)
+            self.guessed_letters = None
+        _drop_properties(self, self.OBSOLETE_PROPERTIES)
+
+    def upgrade(self):
+        """Removes the move log of a game stored before Move existed and
+        returns it as unsaved Moves, to be saved with the game. The old log
+        was a string of [guess, message] lists, with a [message] list after
+        the last move of a lost game; a log that cannot be parsed is kept
+        whole as one Move."""
+        if 'history' not in self._properties:
+            return []
+        history = self._properties['history']._get_value(self) or ''
+        _drop_properties(self, ['history'])
+        try:
+            entries = [[unicode(part) for part in ast.literal_eval(text)]
+                       for text in re.findall(r'\[[^\[\]]*\]', history)]
+        except (ValueError, SyntaxError):
+            entries = None
+        # the log of a game without moves read 'None', and the first entry
+        # of a game was appended to that
+        if entries is None or not all(entries) or (
+                not entries and history.strip() not in ('', 'None')):
+            entries = [['', history]]
+        moves = []
+        for entry in entries:
+            if len(entry) == 1 and moves:
+                moves[-1].message = entry[0]
+                continue
+            self.move_count = (self.move_count or 0) + 1
+            moves.append(Move(key=Move.key_for(self.key, self.move_count),
+                              guess=entry[0] if len(entry) > 1 else '',
+                              message=entry[-1]))
+        return moves
 
     @classmethod
     def new_game(cls, user, min, max, attempts):
-        """Creates and returns a new game"""
+        """Creates and returns a new game. min and max bound the length of
+        the target word; a ValueError is raised if no word fits them."""
+        return cls.new_game_async(user, min, max, attempts).get_result()
+
+    @classmethod
+    @ndb.tasklet
+    def new_game_async(cls, user, min, max, attempts):
         game = Game(user=user,
-                    # target_word chooses random word from txt file
-                    target_word = random.choice([line.strip() for line in 
-                        open('wordlist.txt')]),
+                    # target_word is picked from the preloaded dictionary
+                    target_word=get_dictionary().random_word(min, max),
                     attempts_allowed=attempts,
                     attempts_remaining=attempts,
                     game_over=False)
-        game.put()
+
+        @ndb.tasklet
+        def txn():
+            yield game.put_async()
+            # the counters are updated by tasks that run once the game is
+            # saved, like a move's
+            add_tasks(counters.increment_tasks(game.counter_deltas(0, False)))
+        yield ndb.transaction_async(txn)
+        raise ndb.Return(game)
+
+    @classmethod
+    @ndb.transactional
+    def cancel(cls, key):
+        """Deletes an unfinished game and its Moves in a transaction, which
+        also queues the matching change of the active games counters.
+        Returns the game as read, not deleted if it is already over, or None
+        if it does not exist."""
+        game = key.get()
+        if game and not game.game_over:
+            moves = Move.query(ancestor=key).fetch(keys_only=True)
+            ndb.delete_multi([key] + moves)
+            add_tasks(counters.increment_tasks({
+                counters.ACTIVE_GAMES: -1,
+                counters.ATTEMPTS_REMAINING: -game.attempts_remaining}))
         return game
 
+    def board(self):
+        """Returns the engine Board for the letters guessed so far"""
+        mask = self.guessed_mask
+        if mask is None:
+            # Games created before guessed_mask only stored the letters.
+            mask = letters_to_mask(self.guessed_letters)
+        return Board(self.target_word, mask)
+
+    def make_move(self, guess_letter=None, guess_word=None):
+        """Applies a guess to the game without writing it and returns the
+        engine MoveResult. Ends the game (unsaved) if the move finished it."""
+        board = self.board()
+        result = play_move(board, self.attempts_remaining,
+                           guess_letter, guess_word)
+        if result.changed:
+            self.guessed_mask = board.guessed_mask
+            self.attempts_remaining = result.attempts_remaining
+        return result
+
+    def counter_deltas(self, attempts_before, was_active=True):
+        """Returns the changes to the active games counters (see counters.py)
+        between a previous state of the game and its current state."""
+        before = attempts_before if was_active else 0
+        if self.game_over:
+            return {counters.ACTIVE_GAMES: -1 if was_active else 0,
+                    counters.ATTEMPTS_REMAINING: -before}
+        return {counters.ACTIVE_GAMES: 0 if was_active else 1,
+                counters.ATTEMPTS_REMAINING: self.attempts_remaining - before}
+
+    def record_move(self, result):
+        """Returns a new, unsaved Move entry for an engine MoveResult. It
+        must be saved in the same batch as the game."""
+        self.move_count = (self.move_count or 0) + 1
+        return Move(key=Move.key_for(self.key, self.move_count),
+                    guess=result.guess, message=result.message)
+
     def to_form(self, message):
         """Returns a GameForm representation of the Game"""
+        return self.to_form_async(message).get_result()
+
+    @ndb.tasklet
+    def to_form_async(self, message):
+        user = yield self.user.get_async()
         form = GameForm()
         form.urlsafe_key = self.key.urlsafe()
-        form.user_name = self.user.get().name
+        form.user_name = user.name
         form.attempts_remaining = self.attempts_remaining
         form.game_over = self.game_over
         form.message = message
-        return form
+        raise ndb.Return(form)
 
     def to_gamelistform(self):
         """Returns a GameListForm representation of the Game"""
@@ -89,30 +379,271 @@ class Game(ndb.Model):
         form.urlsafe_key = self.key.urlsafe()
         return form
 
-    def end_game(self, won=False):
-        """Ends the game - if won is True, the player won. - if won is False,
-        the player lost."""
+    def finish(self, won=False):
+        """Marks the game over and returns its unsaved Score, recorded by a
+        task queued with the move (see cache.py). The score is keyed by the
+        game's id so recording it again is harmless."""
         self.game_over = True
-        self.put()
         # measure the # of remaining attempts as score
         # Add the game to the score 'board'
-        score = Score(user=self.user, date=date.today(), won=won, 
-                    guesses=self.attempts_allowed - self.attempts_remaining,
-                    )
-        
-        score.put()
+        return Score(id=self.key.id(), user=self.user, date=date.today(),
+                     won=won,
+                     guesses=score_guesses(self.attempts_allowed,
+                                           self.attempts_remaining))
+
+
+class Move(ndb.Model):
+    """A single move of a Game. Moves are children of their Game keyed by
+    move number, so the log is append-only and reads back in order by key."""
+    guess = ndb.StringProperty(required=True, indexed=False)
+    message = ndb.StringProperty(required=True, indexed=False)
+
+    @classmethod
+    def key_for(cls, game_key, number):
+        return ndb.Key(cls, number, parent=game_key)
+
+    def to_form(self):
+        return MoveForm(number=self.key.id(), guess=self.guess,
+                        message=self.message)
+
+
+class ArchivedGame(ndb.Model):
+    """Compact record of a finished Game, keyed by the game's id. It replaces
+    the Game and its Move log once the game has been over for a while (see
+    archive.py); the log is kept as compressed [[guess, message], ...]."""
+    user = ndb.KeyProperty(required=True, kind='User', indexed=False)
+    target_word = ndb.StringProperty(required=True, indexed=False)
+    attempts_remaining = ndb.IntegerProperty(required=True, indexed=False)
+    finished = ndb.DateTimeProperty(indexed=False)
+    moves = ndb.JsonProperty(compressed=True)
+
+    @classmethod
+    def from_game(cls, game, moves):
+        """Returns an unsaved ArchivedGame for a Game and its Moves in order"""
+        return cls(id=game.key.id(), user=game.user,
+                   target_word=game.target_word,
+                   attempts_remaining=game.attempts_remaining,
+                   finished=game.last_move,
+                   moves=[[move.guess, move.message] for move in moves])
+
+    @classmethod
+    def for_game_key(cls, game_key):
+        return cls.get_by_id(game_key.id())
+
+    def to_form(self, message):
+        """Returns a GameForm as the archived game's last state"""
+        return GameForm(urlsafe_key=ndb.Key(Game, self.key.id()).urlsafe(),
+                        user_name=self.user.get().name,
+                        attempts_remaining=self.attempts_remaining,
+                        game_over=True, message=message)
+
+    def move_forms(self):
+        return [MoveForm(number=number, guess=guess, message=message)
+                for number, (guess, message)
+                in enumerate(self.moves or [], 1)]
 
 
 class Score(ndb.Model):
     """Score object"""
     user = ndb.KeyProperty(required=True, kind='User')
-    date = ndb.DateProperty(required=True)
+    date = ndb.DateProperty(required=True, indexed=False)
     won = ndb.BooleanProperty(required=True)
     guesses = ndb.IntegerProperty(required=True)
-    def to_form(self):
-        return ScoreForm(user_name=self.user.get().name, won=self.won,
+
+    ## memcache counter bumped whenever a Score is recorded or a high score
+    ## board changes
+    VERSION_KEY = 'scores:version'
+    BUMP_VERSION_URL = '/tasks/bump_scores_version'
+    ## Seconds after which the score queries normally include a new Score
+    VERSION_LAG_SECONDS = 10
+
+    @classmethod
+    def version(cls):
+        """Returns a number that changes whenever a Score is recorded or a
+        high score board changes (see HighScoreBoard.add). If
+        memcache lost it, it restarts from a random 63-bit value, so it is
+        very unlikely to repeat a value handed out before."""
+        version = memcache.get(cls.VERSION_KEY)
+        if version is None:
+            memcache.add(cls.VERSION_KEY, random.getrandbits(63))
+            version = memcache.get(cls.VERSION_KEY)
+        return version
+
+    RECORD_URL = '/tasks/record_score'
+
+    @classmethod
+    def bump_version(cls):
+        memcache.incr(cls.VERSION_KEY, initial_value=random.getrandbits(63))
+
+    @classmethod
+    def bump_version_task(cls):
+        """Returns a task that bumps the version again VERSION_LAG_SECONDS
+        after a Score is recorded. The score queries are eventually
+        consistent, so a page read right after the first bump may lack the
+        Score; the second bump keeps its ETag from staying current."""
+        return taskqueue.Task(url=cls.BUMP_VERSION_URL,
+                              countdown=cls.VERSION_LAG_SECONDS)
+
+    def record(self):
+        """Saves the score and adds it to the user's UserStats in one
+        transaction, which also queues a winning score's addition to the
+        high score boards and a delayed bump of the version. Recording the
+        same score twice has no effect."""
+        self.record_async().get_result()
+
+    def record_task(self):
+        """Returns a task that records the score, queued with the move that
+        finished its game (see cache.py). To be added with utils.add_tasks."""
+        return taskqueue.Task(url=self.RECORD_URL, params={
+            'key': self.key.urlsafe(), 'user': self.user.urlsafe(),
+            'date': self.date.toordinal(), 'won': int(self.won),
+            'guesses': self.guesses})
+
+    @ndb.tasklet
+    def record_async(self):
+        user = yield self.user.get_async()
+        shards = (user.stats_shards or 1) if user else 1
+        stats_key = random.choice(UserStats.shard_keys(self.user, shards))
+
+        @ndb.tasklet
+        def txn():
+            if self.key:
+                existing, stats = yield self.key.get_async(), \
+                    stats_key.get_async()
+                if existing:
+                    raise ndb.Return(False)
+            else:
+                stats = yield stats_key.get_async()
+            stats = stats or UserStats(key=stats_key)
+            stats.games += 1
+            stats.wins += 1 if self.won else 0
+            stats.guesses += self.guesses
+            yield ndb.put_multi_async([self, stats])
+            add_tasks([self.bump_version_task()])
+            if self.won:
+                add_tasks([HighScoreBoard.add_task(
+                    self, user.name if user else '')], HighScoreBoard.QUEUE)
+            raise ndb.Return(True)
+        recorded = yield ndb.transaction_async(txn, xg=True)
+        if recorded:
+            self.bump_version()
+
+    def to_form(self, user_name=None):
+        """Returns a ScoreForm, looking up the user's name unless given"""
+        if user_name is None:
+            user_name = self.user.get().name
+        return ScoreForm(user_name=user_name, won=self.won,
                          date=str(self.date), guesses=self.guesses)
 
+class HighScoreBoard(ndb.Model):
+    """The best winning scores of one window, keyed by the window: 'all',
+    'day-YYYY-MM-DD' or 'week-YYYY-WW' (ISO week). entries are
+    [guesses, score id, user id, date ordinal, user name], kept sorted as
+    the Score.won/guesses query orders them and bounded to SIZE. A copy is
+    cached in memcache, so reading a board is one cache fetch. Winning
+    scores are added by tasks on QUEUE, which runs them one at a time, so
+    the boards are written off the request path and never contend."""
+    entries = ndb.JsonProperty()
+
+    SIZE = 200
+    WINDOWS = ('all', 'day', 'week')
+    CACHE_SECONDS = 60
+    ADD_URL = '/tasks/add_high_score'
+    QUEUE = 'high-scores'
+
+    @staticmethod
+    def window_ids(day):
+        """Returns the ids of the boards a score of day belongs to"""
+        year, week, _ = day.isocalendar()
+        return ['all', 'day-{}'.format(day.isoformat()),
+                'week-{}-{:02d}'.format(year, week)]
+
+    @classmethod
+    def window_id(cls, window, day):
+        """Returns the board id of window ('all', 'day' or 'week') for day.
+        Raises ValueError for any other window."""
+        if window not in cls.WINDOWS:
+            raise ValueError('Window must be one of all, day or week!')
+        return cls.window_ids(day)[cls.WINDOWS.index(window)]
+
+    @staticmethod
+    def entry(score, user_name):
+        return [score.guesses, score.key.id(), score.user.id(),
+                score.date.toordinal(), user_name]
+
+    @classmethod
+    def qualifies(cls, entries, entry):
+        return len(entries) < cls.SIZE or entry < entries[-1]
+
+    def insert(self, entry):
+        """Adds entry in O(log SIZE) comparisons if it ranks on the board
+        and is not on it yet. Returns True if the board changed."""
+        entries = self.entries or []
+        i = bisect.bisect_left(entries, entry)
+        if i >= self.SIZE or (i < len(entries) and entries[i] == entry):
+            return False
+        entries.insert(i, entry)
+        del entries[self.SIZE:]
+        self.entries = entries
+        return True
+
+    @staticmethod
+    def _cache_key(board_id):
+        return 'high_scores:' + board_id
+
+    @classmethod
+    def get_entries(cls, board_id):
+        """Returns the entries of a board, best first"""
+        entries = memcache.get(cls._cache_key(board_id))
+        if entries is None:
+            board = cls.get_by_id(board_id)
+            entries = (board.entries or []) if board else []
+            memcache.add(cls._cache_key(board_id), entries,
+                         time=cls.CACHE_SECONDS)
+        return entries
+
+    @classmethod
+    @ndb.tasklet
+    def insert_async(cls, board_id, entries):
+        """Adds entries to a board in a transaction, then caches the new
+        board. Setting rather than deleting the cached copy keeps a reader
+        that loaded the old board from caching it afterwards."""
+        @ndb.tasklet
+        def txn():
+            board = yield cls.get_by_id_async(board_id)
+            board = board or cls(id=board_id)
+            changed = [board.insert(entry) for entry in entries]
+            if not any(changed):
+                raise ndb.Return(None)
+            yield board.put_async()
+            raise ndb.Return(board.entries)
+        board_entries = yield ndb.transaction_async(txn)
+        if board_entries is not None:
+            memcache.set(cls._cache_key(board_id), board_entries,
+                         time=cls.CACHE_SECONDS)
+
+    @classmethod
+    def add_task(cls, score, user_name):
+        """Returns a task, to be queued on QUEUE, that adds a winning score
+        to the boards"""
+        return taskqueue.Task(url=cls.ADD_URL, params={
+            'entry': json.dumps(cls.entry(score, user_name))})
+
+    @classmethod
+    def add(cls, entry):
+        """Adds an entry to the boards of its windows, then bumps
+        Score.version once the new boards are cached. Boards whose
+        cached copy shows the entry does not rank are not touched."""
+        board_ids = cls.window_ids(date.fromordinal(entry[3]))
+        cached = memcache.get_multi(board_ids, key_prefix='high_scores:')
+        for future in [cls.insert_async(board_id, [entry])
+                       for board_id in board_ids
+                       if board_id not in cached or
+                       cls.qualifies(cached[board_id], entry)]:
+            future.get_result()
+        Score.bump_version()
+
+
 class GameForm(messages.Message):
     """GameForm for outbound game state information"""
     urlsafe_key = messages.StringField(1, required=True)
@@ -129,6 +660,7 @@ class GameListForm(messages.Message):
 class GameListForms(messages.Message):
     """Return multiple game entries."""
     items = messages.MessageField(GameListForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
 
 class NewGameForm(messages.Message):
     """Used to create a new game"""
@@ -142,6 +674,39 @@ class MakeMoveForm(messages.Message):
     guess_letter = messages.StringField(1)
     guess_word = messages.StringField(2)
 
+class MakeMovesForm(messages.Message):
+    """Used to make several moves in an existing game"""
+    moves = messages.MessageField(MakeMoveForm, 1, repeated=True)
+
+class GameMovesForm(messages.Message):
+    """Moves to make in one game of a bulk request"""
+    urlsafe_game_key = messages.StringField(1, required=True)
+    moves = messages.MessageField(MakeMoveForm, 2, repeated=True)
+
+class BulkMovesForm(messages.Message):
+    """Used to make moves in several games at once"""
+    items = messages.MessageField(GameMovesForm, 1, repeated=True)
+
+class MoveResultForm(messages.Message):
+    """Outcome of a single move of a batch"""
+    guess = messages.StringField(1)
+    message = messages.StringField(2, required=True)
+    attempts_remaining = messages.IntegerField(3, required=True)
+    game_over = messages.BooleanField(4, required=True)
+
+class MakeMovesResultForm(messages.Message):
+    """Game state after a batch of moves, with the result of each move. In a
+    bulk response, urlsafe_game_key names the game and error is set if the
+    game's moves were not saved; game is unset if it does not exist."""
+    game = messages.MessageField(GameForm, 1)
+    results = messages.MessageField(MoveResultForm, 2, repeated=True)
+    error = messages.StringField(3)
+    urlsafe_game_key = messages.StringField(4)
+
+class BulkMovesResultForm(messages.Message):
+    """Results of a bulk move request, one item per game"""
+    items = messages.MessageField(MakeMovesResultForm, 1, repeated=True)
+
 class ScoreForm(messages.Message):
     """ScoreForm for outbound Score information"""
     user_name = messages.StringField(1, required=True)
@@ -152,20 +717,84 @@ class ScoreForm(messages.Message):
 class ScoreForms(messages.Message):
     """Return multiple ScoreForms"""
     items = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
 
 class UserRankForm(messages.Message):
     """User Ranking Information"""
     user = messages.StringField(1, required=True)
     ratio = messages.FloatField(2, required=True)
+    average_guesses = messages.FloatField(3)
+    rank = messages.IntegerField(4)
     
 class UserRankForms(messages.Message):
     """Return User Ranking List"""
     items = messages.MessageField(UserRankForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+
+class MoveForm(messages.Message):
+    """A single move of a Game"""
+    number = messages.IntegerField(1, required=True)
+    guess = messages.StringField(2, required=True)
+    message = messages.StringField(3, required=True)
 
 class GameHistoryForm(messages.Message):
-    """Return History of a Game"""
-    history = messages.StringField(1, required=True)
+    """Return History of a Game, one page of moves at a time"""
+    items = messages.MessageField(MoveForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+
+class HintForm(messages.Message):
+    """Hint for the next move of a game"""
+    letter = messages.StringField(1)
+    candidates = messages.IntegerField(2, required=True)
+    words = messages.StringField(3, repeated=True)
 
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     message = messages.StringField(1, required=True)
+
+class CacheStatsForm(messages.Message):
+    """Game cache counters of one instance"""
+    hit_rate = messages.FloatField(1, required=True)
+    local_hits = messages.IntegerField(2, required=True)
+    memcache_hits = messages.IntegerField(3, required=True)
+    misses = messages.IntegerField(4, required=True)
+    updates = messages.IntegerField(5, required=True)
+    ## move transactions retried after a conflict
+    retries = messages.IntegerField(6, required=True)
+    evictions = messages.IntegerField(8, required=True)
+    get_ms = messages.FloatField(9, required=True)
+    update_ms = messages.FloatField(10, required=True)
+
+
+class RpcStatsForm(messages.Message):
+    """Datastore or memcache RPCs made by one kind of request"""
+    rpc = messages.StringField(1, required=True)
+    calls = messages.IntegerField(2, required=True)
+    per_request = messages.FloatField(3, required=True)
+    bytes_sent = messages.IntegerField(4, required=True)
+    bytes_received = messages.IntegerField(5, required=True)
+
+
+class LatencyBucketForm(messages.Message):
+    """Requests that took at most max_ms (unbounded if unset)"""
+    max_ms = messages.IntegerField(1)
+    count = messages.IntegerField(2, required=True)
+
+
+class RequestStatsForm(messages.Message):
+    """Timing and RPC totals of one endpoint or handler on one instance"""
+    name = messages.StringField(1, required=True)
+    calls = messages.IntegerField(2, required=True)
+    errors = messages.IntegerField(3, required=True)
+    mean_ms = messages.FloatField(4, required=True)
+    p50_ms = messages.FloatField(5, required=True)
+    p99_ms = messages.FloatField(6, required=True)
+    max_ms = messages.FloatField(7, required=True)
+    histogram = messages.MessageField(LatencyBucketForm, 8, repeated=True)
+    rpcs = messages.MessageField(RpcStatsForm, 9, repeated=True)
+    profiles = messages.StringField(10, repeated=True)
+
+
+class RequestStatsForms(messages.Message):
+    """Return multiple RequestStatsForms"""
+    items = messages.MessageField(RequestStatsForm, 1, repeated=True)
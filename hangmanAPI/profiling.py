@@ -0,0 +1,161 @@
+"""profiling.py - Per-request timing and RPC instrumentation.
+
+Endpoint methods (decorated with instrumented) and task handlers (see
+main.InstrumentedHandler) run inside record(name). An apiproxy post-call hook
+attributes every datastore and memcache RPC made while a request runs to
+that request, with the bytes sent and received. Totals and a wall time
+histogram are kept per request name for this instance. A PROFILE_SAMPLE_RATE
+fraction of requests also run under cProfile and keep a short report.
+
+The hooks are installed on whatever apiproxy is current when a request
+starts, so they also work under the local dev server and testbed stubs."""
+
+import collections
+import contextlib
+import copy
+import functools
+import os
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+
+SERVICES = ('datastore_v3', 'memcache')
+# upper bounds of the wall time histogram buckets, the last one is open
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# fraction of requests run under cProfile, set in app.yaml env_variables
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILES_KEPT = 5
+PROFILE_LINES = 20
+
+_local = threading.local()
+_lock = threading.Lock()
+_hooked = set()
+
+
+class RequestStats(object):
+    """Totals for one request name"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        # 'service.Call' -> [calls, bytes sent, bytes received]
+        self.rpcs = collections.defaultdict(lambda: [0, 0, 0])
+        self.profiles = collections.deque(maxlen=PROFILES_KEPT)
+
+    def add(self, elapsed_ms, error, rpcs, profile):
+        self.calls += 1
+        self.errors += error
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        bucket = 0
+        while (bucket < len(LATENCY_BUCKETS_MS) and
+               elapsed_ms > LATENCY_BUCKETS_MS[bucket]):
+            bucket += 1
+        self.histogram[bucket] += 1
+        for rpc, counts in rpcs.items():
+            totals = self.rpcs[rpc]
+            for i, count in enumerate(counts):
+                totals[i] += count
+        if profile:
+            self.profiles.append(profile)
+
+    def percentile(self, p):
+        """Estimates the p-th latency percentile (ms) from the histogram as
+        the upper bound of its bucket; the open bucket reports max_ms."""
+        if not self.calls:
+            return 0.0
+        rank = p * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), self.max_ms)
+        return self.max_ms
+
+
+_stats = collections.defaultdict(RequestStats)
+
+
+def _post_call(service, call, request, response, rpc=None, error=None):
+    rpcs = getattr(_local, 'rpcs', None)
+    if rpcs is None or service not in SERVICES:
+        return
+    counts = rpcs['{}.{}'.format(service, call)]
+    counts[0] += 1
+    counts[1] += request.ByteSize()
+    if error is None:
+        counts[2] += response.ByteSize()
+
+
+def _install_hooks():
+    # testbed and the dev server may replace the apiproxy after import
+    proxy = apiproxy_stub_map.apiproxy
+    if id(proxy) not in _hooked:
+        proxy.GetPostCallHooks().Append('profiling', _post_call)
+        _hooked.add(id(proxy))
+
+
+def _profile_report(profile):
+    import pstats
+    from StringIO import StringIO
+    out = StringIO()
+    pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(
+        PROFILE_LINES)
+    return out.getvalue()
+
+
+@contextlib.contextmanager
+def record(name):
+    """Times the enclosed block and attributes its RPCs to name. Nested
+    blocks count towards the outermost one."""
+    if getattr(_local, 'rpcs', None) is not None:
+        yield
+        return
+    _install_hooks()
+    _local.rpcs = rpcs = collections.defaultdict(lambda: [0, 0, 0])
+    profile = None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        # profiling modules are only loaded once a request is sampled
+        import cProfile
+        profile = cProfile.Profile()
+    error = False
+    started = time.time()
+    if profile:
+        profile.enable()
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        if profile:
+            profile.disable()
+        elapsed_ms = (time.time() - started) * 1000
+        _local.rpcs = None
+        report = _profile_report(profile) if profile else None
+        with _lock:
+            _stats[name].add(elapsed_ms, error, rpcs, report)
+
+
+def instrumented(method):
+    """Decorator recording a HangmanApi method under its name. Goes below
+    @endpoints.method."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with record(method.__name__):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+def stats(name=None):
+    """Returns {request name: RequestStats} for this instance, or only the
+    one for name"""
+    with _lock:
+        if name is None:
+            return copy.deepcopy(dict(_stats))
+        return {name: copy.deepcopy(_stats[name])} if name in _stats else {}
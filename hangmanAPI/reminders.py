@@ -0,0 +1,86 @@
+"""reminders.py - Reminder emails for users with unfinished games.
+
+A run is a chain of taskqueue tasks. Each collect task reads one page of a
+distinct projection query for the users of unfinished games, fans the page
+out to a send task, and queues the next collect task with the query cursor
+as its checkpoint. Tasks are named after the run and page, so a retried
+collect task does not send a batch twice. Send tasks resolve the users with
+one get_multi and send the emails."""
+
+import logging
+import time
+
+from google.appengine.api import memcache, taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Game
+
+COLLECT_URL = '/tasks/collect_reminders'
+SEND_URL = '/tasks/send_reminders'
+BATCH_SIZE = 100
+
+
+def start():
+    """Starts a reminder run and returns its id"""
+    run = str(int(time.time()))
+    _add_task(COLLECT_URL, run, 0, {})
+    return run
+
+
+def _add_task(url, run, page, params):
+    params = dict(params, run=run, page=page)
+    name = '{}-{}-{}'.format(url.rsplit('/', 1)[-1], run, page)
+    try:
+        taskqueue.add(url=url, name=name, params=params)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        logging.info('Reminder task %s already queued', name)
+
+
+def collect(run, page, cursor=None):
+    """Fans out one page of users with unfinished games and queues the next
+    page."""
+    query = Game.query(Game.game_over == False,
+                       projection=[Game.user], distinct=True)
+    games, next_cursor, more = query.fetch_page(
+        BATCH_SIZE, start_cursor=Cursor(urlsafe=cursor) if cursor else None)
+    if games:
+        _add_task(SEND_URL, run, page,
+                  {'users': ','.join(game.user.urlsafe() for game in games)})
+    if more and next_cursor:
+        _add_task(COLLECT_URL, run, page + 1,
+                  {'cursor': next_cursor.urlsafe()})
+    else:
+        logging.info('Reminder run %s collected %d pages', run, page + 1)
+
+
+def send(run, page, urlsafe_keys):
+    """Emails one batch of users about their unfinished games"""
+    # imported here so that instances which never send mail skip them
+    from google.appengine.api import app_identity, mail
+    started = time.time()
+    users = ndb.get_multi([ndb.Key(urlsafe=key) for key in urlsafe_keys])
+    sender = 'noreply@{}.appspotmail.com'.format(
+        app_identity.get_application_id())
+    sent = 0
+    for user in users:
+        if not user or not user.email:
+            continue
+        subject = 'This is a reminder!'
+        body = 'Hello {}, you have incomplete Hangman games!'.format(user.name)
+        # This will send test emails, the arguments to send_mail are:
+        # from, to, subject, body
+        mail.send_mail(sender, user.email, subject, body)
+        sent += 1
+    memcache.incr('reminders:{}:sent'.format(run), sent, initial_value=0)
+    memcache.incr('reminders:{}:batches'.format(run), initial_value=0)
+    logging.info('Reminder run %s batch %d: %d users, %d emails in %.2fs',
+                 run, page, len(urlsafe_keys), sent, time.time() - started)
+
+
+def metrics(run):
+    """Returns {'sent': n, 'batches': n} for a reminder run so far"""
+    counters = memcache.get_multi(['sent', 'batches'],
+                                  key_prefix='reminders:{}:'.format(run))
+    return {'sent': counters.get('sent', 0),
+            'batches': counters.get('batches', 0)}
@@ -0,0 +1,95 @@
+"""scores.py - Pages of Scores for the score listings.
+
+The score endpoints in api.py and their compact variants in main.py read
+their pages here. High scores come from the HighScoreBoard entities that
+are updated by a task for each winning score. The compact variants serve a
+page either as protobuf binary (ScoreForms) or as columnar JSON listing each
+user name once, with dates as days since 1970-01-01. Their ETag combines the
+request with Score.version(), so a client polling an unchanged listing gets
+a 304 before any query runs."""
+
+import hashlib
+from collections import namedtuple
+from datetime import date
+
+from google.appengine.ext import ndb
+
+from models import User, Score, HighScoreBoard, ScoreForms
+from utils import get_cursor, get_user_names, page_size
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+EPOCH = date(1970, 1, 1)
+
+
+class ScorePage(namedtuple('ScorePage', ['scores', 'names', 'next_cursor'])):
+    """Scores with {user key: name} for their users"""
+
+    def to_forms(self):
+        return ScoreForms(
+            items=[score.to_form(self.names.get(score.user, ''))
+                   for score in self.scores],
+            next_cursor=self.next_cursor)
+
+    def to_columns(self):
+        """Returns the page as a dict of parallel lists. user holds indexes
+        into users."""
+        users, index = [], {}
+        for score in self.scores:
+            if score.user not in index:
+                index[score.user] = len(users)
+                users.append(self.names.get(score.user, ''))
+        return {'users': users,
+                'user': [index[score.user] for score in self.scores],
+                'date': [(score.date - EPOCH).days for score in self.scores],
+                'won': [int(score.won) for score in self.scores],
+                'guesses': [score.guesses for score in self.scores],
+                'next_cursor': self.next_cursor}
+
+
+def _page(query, limit, cursor):
+    scores, next_cursor, more = query.fetch_page(
+        page_size(limit, PAGE_SIZE, MAX_PAGE_SIZE),
+        start_cursor=get_cursor(cursor))
+    return ScorePage(scores, get_user_names(score.user for score in scores),
+                     next_cursor.urlsafe() if more and next_cursor else None)
+
+
+def all_scores(limit=None, cursor=None):
+    """Returns a page of all scores"""
+    return _page(Score.query(), limit, cursor)
+
+
+def user_scores(user_key, limit=None, cursor=None):
+    """Returns a page of one user's scores"""
+    return _page(Score.query(Score.user == user_key), limit, cursor)
+
+
+def high_scores(limit=None, window='all'):
+    """Returns the best winning scores of window ('all', 'day' or 'week'),
+    fewest guesses first, from the maintained HighScoreBoard. Raises
+    ValueError for an unknown window."""
+    board_id = HighScoreBoard.window_id(window or 'all', date.today())
+    entries = HighScoreBoard.get_entries(board_id)[
+        :page_size(limit, PAGE_SIZE, MAX_PAGE_SIZE)]
+    page, names = [], {}
+    for guesses, score_id, user_id, day, user_name in entries:
+        user = ndb.Key(User, user_id)
+        names[user] = user_name
+        page.append(Score(id=score_id, user=user, won=True, guesses=guesses,
+                          date=date.fromordinal(day)))
+    return ScorePage(page, names, None)
+
+
+def etag(*parts):
+    """Returns an ETag for a listing identified by parts, valid until the
+    next Score is recorded or the day changes (see high_scores windows), or
+    None if the scores version is unavailable. A recorded Score changes the
+    version twice, the second time once the queries include it (see
+    Score.bump_version_task), so a page read in between is not cached."""
+    version = Score.version()
+    if version is None:
+        return None
+    return '"{}"'.format(hashlib.md5('|'.join(
+        [str(version), date.today().isoformat()] +
+        [str(part) for part in parts])).hexdigest())
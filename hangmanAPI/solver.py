@@ -0,0 +1,162 @@
+"""solver.py - Hints and an automatic player built on a pattern index.
+
+The index is built once per instance from the word dictionary. Words are
+bucketed by length and, within a bucket, described by integer bitsets over
+the bucket's words: one per (position, letter) and one per letter for "word
+contains letter". Filtering the candidates for a board is then a handful of
+bitset ANDs rather than a scan of the word list, and letter statistics are
+popcounts of the candidate bitset against the per-letter bitsets."""
+
+import math
+import threading
+
+from dictionary import ALPHABET, get_dictionary, to_bitset
+from engine import HIDDEN, Board, letter_bit, play_move
+
+
+def popcount(bits):
+    return bin(bits).count('1')
+
+
+class _Bucket(object):
+    """Bitset index of the words of one length"""
+    __slots__ = ('start', 'size', 'all', 'positions', 'contains')
+
+    def __init__(self, words, start, end):
+        self.start = start
+        self.size = end - start
+        self.all = (1 << self.size) - 1
+        length = len(words[start]) if self.size else 0
+        at = [dict((letter, []) for letter in ALPHABET)
+              for _ in range(length)]
+        has = dict((letter, []) for letter in ALPHABET)
+        for i in range(self.size):
+            word = words[start + i]
+            for position, letter in enumerate(word):
+                at[position][letter].append(i)
+            for letter in set(word):
+                has[letter].append(i)
+        self.positions = [dict((letter, to_bitset(indices, self.size))
+                               for letter, indices in column.items())
+                          for column in at]
+        self.contains = dict((letter, to_bitset(indices, self.size))
+                             for letter, indices in has.items())
+
+
+class Solver(object):
+    """Candidate filtering and letter choice for hangman boards"""
+
+    def __init__(self, words):
+        self.words = words
+        self._buckets = {}
+        for length in words.lengths():
+            start, end = words.length_range(length, length)
+            self._buckets[length] = _Bucket(words, start, end)
+        # Number of words containing each letter, the fallback when a board
+        # matches no known word.
+        self.frequency = dict(
+            (letter, sum(popcount(b.contains[letter])
+                         for b in self._buckets.values()))
+            for letter in ALPHABET)
+
+    def candidates(self, pattern, guessed_mask):
+        """Returns the bitset of bucket words matching a board pattern
+        ('_' for hidden letters) given the letters guessed so far, and the
+        bucket (None if no word has that length)."""
+        bucket = self._buckets.get(len(pattern))
+        if bucket is None:
+            return 0, None
+        bits = bucket.all
+        revealed = set()
+        hidden = []
+        for position, letter in enumerate(pattern):
+            if letter == HIDDEN:
+                hidden.append(position)
+            else:
+                bits &= bucket.positions[position][letter]
+                revealed.add(letter)
+        for letter in ALPHABET:
+            if not guessed_mask & letter_bit(letter):
+                continue
+            if letter in revealed:
+                # a revealed letter shows in every position it occupies
+                for position in hidden:
+                    bits &= ~bucket.positions[position][letter]
+            else:
+                bits &= ~bucket.contains[letter]
+        return bits, bucket
+
+    def candidate_words(self, pattern, guessed_mask, limit=None):
+        """Returns the words matching a board, at most limit of them"""
+        bits, bucket = self.candidates(pattern, guessed_mask)
+        words = []
+        while bits and (limit is None or len(words) < limit):
+            lowest = bits & -bits
+            words.append(self.words[bucket.start + lowest.bit_length() - 1])
+            bits ^= lowest
+        return words
+
+    def best_letter(self, pattern, guessed_mask, bits=None, bucket=None):
+        """Returns the unguessed letter whose presence splits the candidates
+        most evenly (highest information gain), or the most common unguessed
+        letter when no candidate is left. Returns None if every letter has
+        been guessed."""
+        if bits is None:
+            bits, bucket = self.candidates(pattern, guessed_mask)
+        total = popcount(bits)
+        best, best_score = None, None
+        for letter in ALPHABET:
+            if guessed_mask & letter_bit(letter):
+                continue
+            if total:
+                hits = popcount(bits & bucket.contains[letter])
+                score = (_entropy(hits, total), hits)
+            else:
+                score = (0.0, self.frequency[letter])
+            if best_score is None or score > best_score:
+                best, best_score = letter, score
+        return best
+
+    def solve(self, target_word, attempts=12):
+        """Plays a game against target_word with the real rules. Returns
+        (won, moves made)."""
+        board = Board(target_word)
+        moves = 0
+        while True:
+            bits, bucket = self.candidates(board.pattern, board.guessed_mask)
+            guess_word = guess_letter = None
+            if popcount(bits) == 1:
+                guess_word = self.words[bucket.start + bits.bit_length() - 1]
+            else:
+                guess_letter = self.best_letter(board.pattern,
+                                                board.guessed_mask,
+                                                bits, bucket)
+                if guess_letter is None:
+                    return False, moves
+            result = play_move(board, attempts, guess_letter, guess_word)
+            attempts = result.attempts_remaining
+            moves += 1
+            if result.game_over:
+                return result.won, moves
+
+
+def _entropy(hits, total):
+    """Binary entropy (bits) of a letter present in hits of total words"""
+    if hits == 0 or hits == total:
+        return 0.0
+    p = float(hits) / total
+    return -(p * math.log(p, 2) + (1 - p) * math.log(1 - p, 2))
+
+
+_solver = None
+_lock = threading.Lock()
+
+
+def get_solver():
+    """Returns the instance-wide Solver, building its index on first use"""
+    global _solver
+    if _solver is None:
+        with _lock:
+            if _solver is None:
+                _solver = Solver(get_dictionary())
+    return _solver
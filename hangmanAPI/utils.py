@@ -1,7 +1,11 @@
 """utils.py - File for collecting general utility functions."""
 
 import logging
+import threading
+from collections import OrderedDict
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
+from google.appengine.datastore.datastore_query import Cursor
 import endpoints
 
 def get_by_urlsafe(urlsafe, model):
@@ -17,8 +21,19 @@ def get_by_urlsafe(urlsafe, model):
         exists.
     Raises:
         ValueError:"""
+    entity = key_from_urlsafe(urlsafe).get()
+    if not entity:
+        return None
+    if not isinstance(entity, model):
+        raise ValueError('Incorrect Kind')
+    return entity
+
+
+def key_from_urlsafe(urlsafe):
+    """Returns the ndb.Key for a urlsafe key string. Raises a
+        BadRequestException if it is malformed."""
     try:
-        key = ndb.Key(urlsafe=urlsafe)
+        return ndb.Key(urlsafe=urlsafe)
     except TypeError:
         raise endpoints.BadRequestException('Invalid Key')
     except Exception, e:
@@ -27,9 +42,85 @@ def get_by_urlsafe(urlsafe, model):
         else:
             raise
 
-    entity = key.get()
-    if not entity:
+
+def add_tasks(tasks, queue_name='default'):
+    """Queues taskqueue Tasks. Inside an ndb transaction they are added with
+        it, so they run only if it commits. The taskqueue API joins the
+        transaction that ndb started last in this thread, which may not be the
+        caller's when several transactions run concurrently (see
+        cache.update_multi), so the caller's own connection is selected for
+        the add."""
+    from google.appengine.api import datastore, taskqueue
+    queue = taskqueue.Queue(queue_name)
+    if not ndb.in_transaction():
+        return queue.add(tasks)
+    previous = datastore._GetConnection()
+    datastore._SetConnection(ndb.get_context()._conn)
+    try:
+        return queue.add(tasks, transactional=True)
+    finally:
+        datastore._SetConnection(previous)
+
+
+def get_cursor(urlsafe):
+    """Returns the query Cursor for a urlsafe cursor string, or None if no
+        cursor was given. Raises a BadRequestException if it is malformed."""
+    if not urlsafe:
         return None
-    if not isinstance(entity, model):
-        raise ValueError('Incorrect Kind')
-    return entity
+    try:
+        return Cursor(urlsafe=urlsafe)
+    except Exception:
+        raise endpoints.BadRequestException('Invalid Cursor')
+
+
+def page_size(limit, default, maximum):
+    """Clamps a requested page size to [1, maximum]"""
+    if not limit or limit < 1:
+        return default
+    return min(limit, maximum)
+
+
+def get_user_names(user_keys):
+    """Returns {user key: name} for the given User keys. Names are read from
+        memcache and the misses with a single get_multi."""
+    user_keys = list(set(user_keys))
+    cache_keys = dict(('user_name:{}'.format(key.id()), key)
+                      for key in user_keys)
+    cached = memcache.get_multi(cache_keys.keys())
+    names = dict((cache_keys[k], name) for k, name in cached.items())
+    missing = [key for key in user_keys if key not in names]
+    if missing:
+        loaded = dict((user.key, user.name)
+                      for user in ndb.get_multi(missing) if user)
+        memcache.set_multi(dict(('user_name:{}'.format(key.id()), name)
+                                for key, name in loaded.items()))
+        names.update(loaded)
+    return names
+
+
+class LRUCache(object):
+    """Small thread-safe in-process mapping that keeps the most recently
+        used size entries."""
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value = self._entries[key] = self._entries.pop(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)